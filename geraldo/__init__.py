@@ -27,10 +27,17 @@ Packages Structure
 
 - cross_reference.py - contains the cross reference table matrix class.
 
+- dataset.py - contains datasets shared by processes in memory-mapped files.
+
+- datasources.py - contains data sources used as querysets, as SQL queries and
+  CSV, JSON Lines and fixed width files.
+
 - exceptions.py - contains Geraldo specific exceptions.
 
 - graphics.py - contains graphic classes and definitions
 
+- pool.py - contains the pool of report worker processes.
+
 - models.py - there is nothing. Just to be compatible with Django pluggable
   application structure and make possible run tests suite.
 
@@ -51,7 +58,8 @@ __url__ = 'http://geraldo.sourceforge.net/'
 __version__ = get_version()
 
 from .base import Report, ReportBand, DetailBand, TableBand, ReportGroup,\
-        SubReport, landscape, GeraldoObject, ManyElements, CROSS_COLS
+        SubReport, landscape, GeraldoObject, ManyElements, CROSS_COLS,\
+        ReportComposition
 from .widgets import Label, ObjectValue, SystemField
 from .widgets import FIELD_ACTION_VALUE, FIELD_ACTION_COUNT, FIELD_ACTION_AVG,\
         FIELD_ACTION_MIN, FIELD_ACTION_MAX, FIELD_ACTION_SUM,\
@@ -1,7 +1,9 @@
 """Module with BarCodes functions on Geraldo."""
 
+import threading
+
 from .graphics import Graphic
-from .utils import memoize, get_attr_value, cm
+from .utils import memoize, get_attr_value, cm, LRUCache
 
 from reportlab.graphics.barcode import getCodeNames
 from reportlab.graphics.barcode.common import Codabar, Code11, I2of5, MSI
@@ -31,6 +33,23 @@ BARCODE_CLASSES = {
     'USPS_4State': USPS_4State,
 }
 
+# Maximum count of rendered barcodes kept by the barcodes cache
+BARCODE_CACHE_MAX_ITEMS = 1000
+
+# Rendered barcodes are shared by elements and pages with the same type, value,
+# checksum and dimensions, by thread, as drawing a barcode sets attributes on
+# it, and generators can draw at the same time on threads
+_barcodes_caches = threading.local()
+
+def get_barcodes_cache():
+    """Returns the cache of rendered barcodes of the current thread"""
+    cache = getattr(_barcodes_caches, 'cache', None)
+
+    if cache is None:
+        cache = _barcodes_caches.cache = LRUCache(BARCODE_CACHE_MAX_ITEMS)
+
+    return cache
+
 class BarCode(Graphic):
     """Class used by all barcode types generation. A barcode is just another graphic
     element, with basic attributes, like 'left', 'top', 'width', 'height' and
@@ -78,21 +97,38 @@ class BarCode(Graphic):
                 'barWidth': self.width,
                 'barHeight': self.height,
                 }
-            
-            if self.type in ('EAN13','EAN8',):
-                self._rendered_drawing = createBarcodeDrawing(self.type, **kwargs)
-            else:
-                cls = BARCODE_CLASSES[self.type]
 
+            if self.type not in ('EAN13','EAN8',):
                 kwargs['checksum'] = self.checksum
 
                 if self.type in ('USPS_4State',):
                     kwargs['routing'] = get_attr_value(self.instance, self.routing_attribute)
 
-                self._rendered_drawing = cls(**kwargs)
+            # Looks for the same barcode rendered before
+            key = (self.type,) + tuple(sorted(kwargs.items()))
+            barcodes_cache = get_barcodes_cache()
+            try:
+                drawing = barcodes_cache.get(key)
+            except TypeError: # Unhashable values
+                key = drawing = None
+
+            if drawing is None:
+                drawing = self.make_drawing(**kwargs)
+
+                if key:
+                    barcodes_cache.set(key, drawing)
+
+            self._rendered_drawing = drawing
 
         return self._rendered_drawing
 
+    def make_drawing(self, **kwargs):
+        """Creates the ReportLab barcode drawing"""
+        if self.type in ('EAN13','EAN8',):
+            return createBarcodeDrawing(self.type, **kwargs)
+
+        return BARCODE_CLASSES[self.type](**kwargs)
+
     def get_object_value(self, instance=None):
         """Return the attribute value for just an object"""
 
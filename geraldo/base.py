@@ -1,4 +1,4 @@
-import copy, types
+import copy, types, threading, asyncio
 
 try: 
     set 
@@ -7,7 +7,7 @@ except NameError:
 
 from .utils import calculate_size, get_attr_value, landscape, format_date, memoize,\
         BAND_WIDTH, BAND_HEIGHT, CROSS_COLS, CROSS_ROWS, cm, A4, black, TA_LEFT, TA_CENTER,\
-        TA_RIGHT
+        TA_RIGHT, AsyncIterableReader, AsyncChunksWriter
 from .exceptions import EmptyQueryset, ObjectNotFound, ManyObjectsFound,\
         AttributeNotFound, NotYetImplemented
 from .cache import DEFAULT_CACHE_STATUS, CACHE_BACKEND, CACHE_FILE_ROOT
@@ -322,6 +322,9 @@ class BaseReport(GeraldoObject):
         return system_fields.widget.generator.variables[name]
 
 
+# Minimum size of chunks from 'Report.agenerate_chunks_by'
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
 # Useful to find declared report classes without manual registration
 _registered_report_classes = []
 
@@ -389,6 +392,17 @@ class Report(BaseReport, metaclass=ReportMetaclass):
     # Look and feel
     additional_fonts = None
     default_style = None
+    reuse_images = True # Images are embedded once per document and drawn by reference
+    reuse_charts = True # Same charts are drawn once per document and drawn by reference
+    reuse_static_bands = True # Page-invariant elements of page header/footer and
+                              # page borders are drawn once per document
+
+    # Prepared report this one is bound to (see 'prepare')
+    prepared = None
+
+    # Executor running generations from 'agenerate_by' (the default executor of
+    # the event loop if None)
+    async_executor = None
 
     # Caching related attributes
     cache_status = None
@@ -397,10 +411,12 @@ class Report(BaseReport, metaclass=ReportMetaclass):
     cache_file_root = None
 
     def __init__(self, queryset=None):
+        # Subreports keep state while rendering, so every report has its copies
+        self.subreports = [copy.copy(subreport) for subreport in self.subreports or []]
+
         super(Report, self).__init__(queryset)
 
         # Default attributes
-        self.subreports = self.subreports and list(self.subreports) or []
         self.default_style = self.default_style or {}
         self.additional_fonts = self.additional_fonts or {}
 
@@ -417,6 +433,16 @@ class Report(BaseReport, metaclass=ReportMetaclass):
         # Calls the method that set this as parent if their children
         self.set_parent_on_children()
 
+    @classmethod
+    def prepare(cls):
+        """Returns the prepared report of this class, made just once, to be bound
+        to a queryset on each request (i.e. 'MyReport.prepare().bind(queryset)')"""
+        with _prepared_reports_lock:
+            if cls not in _prepared_reports:
+                _prepared_reports[cls] = PreparedReport(cls)
+
+        return _prepared_reports[cls]
+
     def generate_by(self, generator_class, *args, **kwargs):
         """This method uses a generator inherited class to generate a report
         to a desired format, like XML, HTML or PDF, for example.
@@ -467,13 +493,60 @@ class Report(BaseReport, metaclass=ReportMetaclass):
         # Loads temp file
         if filelike:
             # Reads the temp file
-            fp = file(kwargs['filename'])
-            cont = fp.read()
-            fp.close()
+            with open(kwargs['filename'], 'rb') as fp:
+                cont = fp.read()
+            os.remove(kwargs['filename'])
 
             # Writes temp file content in file-like object
             filelike.write(cont)
 
+    async def agenerate_by(self, generator_class, *args, **kwargs):
+        """Coroutine doing the same 'generate_by' does, on the executor in
+        argument 'executor' or attribute 'async_executor', so the event loop
+        isn't blocked. The queryset can be an asynchronous iterable, fetched
+        by the event loop while the generator reads it."""
+        loop = asyncio.get_running_loop()
+        executor = kwargs.pop('executor', None) or self.async_executor
+
+        # The reader replaces the queryset just while generating
+        queryset = self.queryset
+        reader = None
+        if hasattr(queryset, '__aiter__'):
+            reader = self.queryset = AsyncIterableReader(queryset, loop)
+
+        try:
+            return await loop.run_in_executor(executor,
+                    lambda: self.generate_by(generator_class, *args, **kwargs))
+        finally:
+            # Readers test as False once their rows are read
+            if reader is not None:
+                reader.close()
+                self.queryset = queryset
+
+    async def agenerate_chunks_by(self, generator_class, *args, **kwargs):
+        """Asynchronous iterator of the output chunks (bytes) of 'agenerate_by',
+        for streaming responses. Argument 'chunk_size' is the size of chunks but
+        the last one."""
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        writer = AsyncChunksWriter(loop, chunks, kwargs.pop('chunk_size', OUTPUT_CHUNK_SIZE))
+        kwargs['filename'] = writer
+
+        task = loop.create_task(self.agenerate_by(generator_class, *args, **kwargs))
+        task.add_done_callback(lambda task: writer.close())
+
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+
+                yield chunk
+
+            await task
+        finally:
+            task.cancel()
+
     def get_page_rect(self):
         """Calculates a dictionary with page dimensions inside the margins
         and returns. It is used to make page borders."""
@@ -492,6 +565,13 @@ class Report(BaseReport, metaclass=ReportMetaclass):
 
         return self._page_rect
 
+    def uses_page_count(self):
+        """Returns True if the report has system fields that can show the page count"""
+        from .widgets import SystemField
+
+        return any(field.get_value or 'page_count' in (field.expression or '')
+                for field in self.find_by_type(SystemField))
+
     def get_children(self):
         ret = super(Report, self).get_children()
 
@@ -515,6 +595,212 @@ class Report(BaseReport, metaclass=ReportMetaclass):
             for subreport in self.subreports:
                 subreport.parent = self
 
+_prepared_reports = {}
+_prepared_reports_lock = threading.Lock()
+
+class PreparedReport(object):
+    """A report instantiated just once by Report.prepare(), with its bands and
+    groups ready and its expressions compiled. Reports bound to querysets share
+    its bands, groups and elements (so they must not be changed after it) and
+    caches of generators, like the classification of elements and wrapped
+    paragraphs."""
+
+    report_class = None
+    report = None
+
+    def __init__(self, report_class):
+        from .widgets import ObjectValue, compile_expression
+
+        self.report_class = report_class
+        self._generator_caches = {}
+        self._lock = threading.Lock()
+
+        self.report = report_class()
+        self.report.prepared = self
+
+        for widget in self.report.find_by_type(ObjectValue):
+            if widget.expression:
+                compile_expression(widget.expression)
+
+    def bind(self, queryset=None):
+        """Returns a report of the prepared class for a queryset. Just the report
+        and its subreports (that keep state while rendering) are copied. The
+        shared bands and groups keep the prepared report as their parent, so
+        reports bound on other threads don't change them."""
+        report = copy.copy(self.report)
+        report.queryset = self.report_class.queryset if queryset is None else queryset
+
+        if report.queryset is None:
+            report.queryset = []
+
+        report.subreports = [copy.copy(subreport) for subreport in self.report.subreports]
+        for subreport in report.subreports:
+            subreport.parent = report
+
+        return report
+
+    def generate_batch_by(self, generator_class, records, filename=None, get_queryset=None,
+            get_filename=None, get_title=None, pool=None, **kwargs):
+        """Generates a report per record (i.e. invoices per customer), from the
+        queryset returned by 'get_queryset(record)' or the record itself.
+
+        If 'filename' is given, the reports are generated to it as one document
+        (PDF only), with an outline entry per record titled by
+        'get_title(record, index)' (default: the report title and the number).
+
+        Otherwise each report is generated to 'get_filename(record, index)', by
+        the workers of the ReportPool in 'pool' (see geraldo.pool) if given.
+
+        Other arguments are passed to the generators."""
+        def make_queryset(record):
+            return record if get_queryset is None else get_queryset(record)
+
+        # One document, sharing the canvas
+        if filename is not None:
+            if pool:
+                raise NotYetImplemented('Combined documents are generated by a single process')
+
+            get_title = get_title or (lambda record, index: '%s %d'%(self.report.title, index + 1))
+
+            canvas = None
+            for index, record in enumerate(records):
+                canvas = self.bind(make_queryset(record)).generate_by(generator_class,
+                        filename=filename, canvas=canvas, return_canvas=True,
+                        outline_title=get_title(record, index), **kwargs)
+
+            if canvas:
+                canvas.save()
+
+            return
+
+        def generate(index, record):
+            if pool:
+                pool.generate_by(self.report_class, make_queryset(record), generator_class,
+                        filename=get_filename(record, index), **kwargs)
+            else:
+                self.bind(make_queryset(record)).generate_by(generator_class,
+                        filename=get_filename(record, index), **kwargs)
+
+        if not pool:
+            for index, record in enumerate(records):
+                generate(index, record)
+            return
+
+        # A thread per worker takes the next record, so the records are read
+        # just as they are generated
+        records = enumerate(records)
+        records_lock = threading.Lock()
+        errors = []
+
+        def feed_worker():
+            while not errors:
+                with records_lock:
+                    try:
+                        index, record = next(records)
+                    except StopIteration:
+                        return
+
+                try:
+                    generate(index, record)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=feed_worker) for num in range(pool.processes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def get_generator_cache(self, generator_class, name, make_cache=dict):
+        """Returns a cache shared by the generators of a class, made by the
+        function 'make_cache' the first time"""
+        key = (generator_class, name)
+
+        with self._lock:
+            if key not in self._generator_caches:
+                self._generator_caches[key] = make_cache()
+
+        return self._generator_caches[key]
+
+class ReportComposition(object):
+    """A document composed by many reports, each one drawn after the previous
+    on the same canvas, with page numbers following and the page count of the
+    whole document. Pages are generated as soon as they are laid out (see
+    'stream_pages' in generators), so the pages of the reports aren't held
+    together in memory.
+
+    'parts' is a sequence of reports or (report, queryset) tuples, where a
+    report can be a report class, instantiated with the queryset. Reports with
+    empty querysets not printed if empty are skipped. If page count fields are
+    used, the querysets are read twice, the first one to count the pages."""
+
+    parts = None
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def get_reports(self):
+        """Returns the reports of the parts, with their querysets"""
+        reports = []
+
+        for part in self.parts:
+            report, queryset = isinstance(part, (list, tuple)) and part or (part, None)
+
+            if isinstance(report, type):
+                report = report(queryset=queryset)
+            elif queryset is not None:
+                report.queryset = queryset
+
+            if report.print_if_empty or report.queryset:
+                reports.append(report)
+
+        return reports
+
+    def get_page_count(self, reports, generator_class, **kwargs):
+        """Sums the page counts of the reports, planned when possible (see
+        ReportGenerator.plan_pages) or laid out one by one"""
+        page_count = 0
+
+        for report in reports:
+            plan = generator_class(report, **kwargs).plan_pages()
+
+            if plan:
+                page_count += plan.page_count
+            else:
+                page_count += len(report.generate_by(generator_class, return_pages=True, **kwargs))
+
+        return page_count
+
+    def generate_by(self, generator_class, filename=None, **kwargs):
+        """Generates the reports to a document (PDF only), in 'filename'. Other
+        arguments are passed to the generators."""
+        reports = self.get_reports()
+
+        page_count = None
+        if any(report.uses_page_count() for report in reports):
+            page_count = self.get_page_count(reports, generator_class, **kwargs)
+
+        canvas = None
+        first_page_number = 1
+
+        for report in reports:
+            # Reports can have different page sizes
+            if canvas:
+                canvas.setPageSize(report.page_size)
+
+            generator = generator_class(report, filename=filename, canvas=canvas,
+                    return_canvas=True, first_page_number=first_page_number,
+                    page_count=page_count, stream_pages=True, **kwargs)
+            canvas = generator.execute()
+
+            first_page_number += generator.get_rendered_page_count()
+
+        if canvas:
+            canvas.save()
+
 class SubReport(BaseReport):
     """Class to be used for subreport objects. It doesn't need to be inherited.
     
@@ -799,6 +1085,8 @@ class Element(GeraldoObject):
     _width = 0
     _height = 0
     visible = True
+    static_key = None # Set by generators on elements drawn the same on every page
+    static_source = None # Set by generators on elements drawn the same for every object
     
     # Events (don't make a method with their names, override 'do_*' instead)
     before_print = None
@@ -807,6 +1095,10 @@ class Element(GeraldoObject):
     # 'width' property
     def _get_width(self):
         if self._width == BAND_WIDTH and self.band:
+            # Rendered elements get the band width of their own generation
+            if getattr(self, 'generator', None):
+                return self.generator.get_band_width(self.band)
+
             return self.band.width
 
         return self._width
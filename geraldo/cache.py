@@ -84,6 +84,31 @@ except ImportError:
     import sha
     hash_constructor = sha.new
 
+def make_objects_reprs(report, objects_list):
+    """Returns a list with the string repr of each object, as used by
+    'make_hash_key', so objects can also be compared one by one."""
+
+    global get_report_cache_attributes
+
+    result = []
+
+    # Get attributes for cache from report
+    if hasattr(report, 'get_cache_relevant_attributes'):
+        report_attrs = report.get_cache_relevant_attributes
+    else:
+        report_attrs = lambda: get_report_cache_attributes(report)
+
+    for obj in objects_list:
+        # Situation 1 - mostly report pages and geraldo objects
+        if hasattr(obj, 'repr_for_cache_hash_key'):
+            result.append(obj.repr_for_cache_hash_key())
+
+        # Situation 2 - mostly queryset objects list
+        else:
+            result.append('/'.join([str(get_attr_value(obj, attr)) for attr in report_attrs()]))
+
+    return result
+
 def make_hash_key(report, objects_list):
     """This function make a hash key from a list of objects.
     
@@ -107,28 +132,11 @@ def make_hash_key(report, objects_list):
     The result list will be transformed to a long concatenated string and a hash key
     will be generated from it."""
 
-    global get_report_cache_attributes
-
-    result = []
-
-    # Get attributes for cache from report
-    if hasattr(report, 'get_cache_relevant_attributes'):
-        report_attrs = report.get_cache_relevant_attributes
-    else:
-        report_attrs = lambda: get_report_cache_attributes(report)
-
-    for obj in objects_list:
-        # Situation 1 - mostly report pages and geraldo objects
-        if hasattr(obj, 'repr_for_cache_hash_key'):
-            result.append(obj.repr_for_cache_hash_key())
-
-        # Situation 2 - mostly queryset objects list
-        else:
-            result.append('/'.join([str(get_attr_value(obj, attr)) for attr in report_attrs()]))
+    result = make_objects_reprs(report, objects_list)
 
     # Makes the hash key
     m = hash_constructor()
-    m.update('\n'.join(result))
+    m.update('\n'.join(result).encode('utf-8'))
 
     return '%s-%s'%(report.cache_prefix, m.hexdigest())
 
@@ -1,4 +1,4 @@
-import re, random, decimal
+import re, random, decimal, threading, hashlib
 
 from reportlab.graphics.shapes import Drawing, String
 from reportlab.graphics.charts.barcharts import HorizontalBarChart as OriginalHorizBarChart
@@ -12,12 +12,73 @@ from reportlab.graphics.charts.spider import SpiderChart as OriginalSpiderChart
 from reportlab.graphics.charts.legends import Legend
 from reportlab.lib.colors import HexColor, getAllNamedColors
 
-from .utils import cm, memoize, get_attr_value
+from .utils import cm, memoize, get_attr_value, LRUCache
+from .exceptions import AttributeNotFound
 from .cross_reference import CrossReferenceMatrix, CROSS_COLS, CROSS_ROWS
 from .graphics import Graphic
 import collections
 
 DEFAULT_TITLE_HEIGHT = 1*cm
+CHART_CACHE_MAX_ITEMS = 100
+
+# Cross-reference matrices shared by charts with the same definition and data
+charts_cache = LRUCache(CHART_CACHE_MAX_ITEMS)
+
+# Fingerprints of the data objects of charts, computed once per object (kept
+# with it, so its id is not reused). Data objects must not change while they
+# are reported.
+data_fingerprints = LRUCache(CHART_CACHE_MAX_ITEMS)
+
+# Drawings of charts with the same definition and data are shared by thread,
+# as drawing one sets attributes on its shapes, and generators can draw at the
+# same time on threads
+_drawings_caches = threading.local()
+
+def get_drawings_cache():
+    """Returns the cache of chart drawings of the current thread"""
+    cache = getattr(_drawings_caches, 'cache', None)
+
+    if cache is None:
+        cache = _drawings_caches.cache = LRUCache(CHART_CACHE_MAX_ITEMS)
+
+    return cache
+
+def largest_triangle_three_buckets(values, threshold):
+    """Returns the indices of the points to keep to draw a series of values
+    with no more than 'threshold' points, keeping its visual shape, using the
+    Largest-Triangle-Three-Buckets algorithm."""
+    count = len(values)
+
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    values = [value or 0 for value in values]
+    every = (count - 2) / float(threshold - 2)
+    indices = [0]
+    a = 0
+
+    for bucket in range(threshold - 2):
+        # Average point of the next bucket
+        avg_start = int((bucket + 1) * every) + 1
+        avg_end = min(int((bucket + 2) * every) + 1, count)
+        avg_x = (avg_start + avg_end - 1) / 2.0
+        avg_y = sum(values[avg_start:avg_end]) / float(avg_end - avg_start)
+
+        # Point of the current bucket making the largest triangle with the
+        # point kept before and the average point of the next bucket
+        max_area = -1
+        for num in range(int(bucket * every) + 1, int((bucket + 1) * every) + 1):
+            area = abs((a - avg_x) * (values[num] - values[a]) - (a - num) * (avg_y - values[a]))
+            if area > max_area:
+                max_area = area
+                next_a = num
+
+        indices.append(next_a)
+        a = next_a
+
+    indices.append(count - 1)
+
+    return indices
 
 class BaseChart(Graphic):
     """Abstract chart class"""
@@ -40,6 +101,12 @@ class BaseChart(Graphic):
     replace_none_by_zero = True
     round_values = False
     summarize_by = None # Can be None, CROSS_ROWS or CROSS_COLS
+    cache_enabled = True
+
+    _cache_key_attrs = ('width','height','rows_attribute','cols_attribute',
+            'cell_attribute','action','title','colors','chart_style',
+            'axis_labels','axis_labels_angle','legend_labels','values_labels',
+            'replace_none_by_zero','round_values','summarize_by')
 
     def __init__(self, **kwargs):
         # Set instance attributes
@@ -86,6 +153,7 @@ class BaseChart(Graphic):
         new.replace_none_by_zero = self.replace_none_by_zero
         new.round_values = self.round_values
         new.summarize_by = self.summarize_by
+        new.cache_enabled = self.cache_enabled
 
         return new
 
@@ -210,17 +278,31 @@ class BaseChart(Graphic):
         else:
             labels = self.get_cross_data().cols()
 
+        # Just the labels of the points drawn are calculated
+        indices = self.get_axis_labels_indices(len(labels))
+        if indices is None:
+            indexed = list(enumerate(labels))
+        else:
+            indexed = [(num, labels[num]) for num in indices]
+
         # Calculated labels
         if isinstance(self.axis_labels, collections.Callable):
-            labels = [self.axis_labels(self, label, num) for num, label in enumerate(labels)]
+            labels = [self.axis_labels(self, label, num) for num, label in indexed]
         elif isinstance(self.axis_labels, str):
             if self.summarize_by == CROSS_ROWS:
-                labels = [self.get_cross_data().first(self.axis_labels, row=label) for label in labels]
+                labels = [self.get_cross_data().first(self.axis_labels, row=label) for num, label in indexed]
             else:
-                labels = [self.get_cross_data().first(self.axis_labels, col=label) for label in labels]
+                labels = [self.get_cross_data().first(self.axis_labels, col=label) for num, label in indexed]
+        else:
+            labels = [label for num, label in indexed]
 
         return list(map(str, labels))
 
+    def get_axis_labels_indices(self, count):
+        """Returns the indices of the axis labels to show, of 'count' labels, or
+        None for all of them"""
+        return None
+
     def make_title(self, drawing):
         if not self.title:
             return
@@ -249,27 +331,90 @@ class BaseChart(Graphic):
 
             if not isinstance(data, CrossReferenceMatrix):
                 if self.rows_attribute: # and self.cols_attribute:
-                    data = CrossReferenceMatrix(
-                            data,
-                            self.rows_attribute,
-                            self.cols_attribute,
-                            decimal_as_float=True,
-                            )
+                    key = self.get_cache_key(data, 'cross')
+                    matrix = key and charts_cache.get(key)
+
+                    if matrix is None:
+                        matrix = CrossReferenceMatrix(
+                                data,
+                                self.rows_attribute,
+                                self.cols_attribute,
+                                decimal_as_float=True,
+                                )
+
+                        if key:
+                            charts_cache.set(key, matrix)
+
+                    data = matrix
 
             self._cross_data = data
 
         return self._cross_data
 
-    def get_data(self):
-        data = self.data
+    def get_source_data(self):
+        """Returns the objects list (or cross-reference matrix) the chart is
+        made from"""
+        if getattr(self, '_source_data', None) is None:
+            data = self.data
 
-        # Returns nothing data is empty
-        if not data:
-            data = self.report.queryset # TODO: Change to support current objects
-                                        # list (for subreports and groups)
+            # Returns nothing data is empty
+            if not data:
+                data = self.report.queryset # TODO: Change to support current objects
+                                            # list (for subreports and groups)
+
+            if isinstance(data, str):
+                data = get_attr_value(self.instance, data)
+
+            # Keeps iterators available to be read more than once
+            if data is not None and not isinstance(data, (CrossReferenceMatrix, list, tuple)):
+                data = list(data)
+
+            self._source_data = data
+
+        return self._source_data
+
+    def get_data_fingerprint(self, data):
+        """Returns a hashable value that changes when the values used by the
+        chart change"""
+        if isinstance(data, CrossReferenceMatrix):
+            return ('matrix', id(data))
 
+        attrs = tuple([attr for attr in (self.rows_attribute, self.cols_attribute,
+            self.cell_attribute, self.axis_labels, self.legend_labels)
+            if attr and isinstance(attr, str)])
+
+        key = (id(data), attrs)
+        cached = data_fingerprints.get(key)
+        if cached is None or cached[0] is not data:
+            values = tuple([tuple([get_attr_value(obj, attr) for attr in attrs]) for obj in data])
+            hash(values) # Unhashable values can't be cached
+            cached = (data, hashlib.sha1(repr(values).encode('utf-8')).hexdigest())
+            data_fingerprints.set(key, cached)
+
+        return cached[1]
+
+    def get_cache_key(self, data=None, kind='drawing'):
+        """Returns the key to find the rendered chart (or its cross-reference
+        matrix) in the cache, or None if it cannot be cached"""
+        if not self.cache_enabled:
+            return None
+
+        if data is None:
+            data = self.get_source_data()
+
+        try:
+            key = (kind, self.__class__, self.chart_class,
+                    str(dict([(attr, getattr(self, attr, None)) for attr in self._cache_key_attrs])),
+                    self.get_data_fingerprint(data or []))
+            hash(key)
+        except (TypeError, AttributeNotFound):
+            return None
+
+        return key
+
+    def get_data(self):
         # Transforms data to cross-reference matrix
-        data = self.get_cross_data(data)
+        data = self.get_cross_data(self.get_source_data())
 
         # Summarize data or get its matrix (after it is a Cross-Reference Matrix)
         if self.summarize_by == CROSS_ROWS:
@@ -333,6 +478,25 @@ class BaseChart(Graphic):
         return chart
 
     def render(self):
+        """Returns the chart drawing, reusing the one rendered before by this
+        thread for same chart definition and data"""
+        key = self.get_cache_key()
+        drawings_cache = get_drawings_cache()
+        drawing = key and drawings_cache.get(key)
+
+        if drawing is None:
+            drawing = self.make_drawing()
+
+            if key and drawing:
+                drawings_cache.set(key, drawing)
+
+        # Title offset set by get_drawing()
+        elif self.title:
+            self.top += self.title.get('height', DEFAULT_TITLE_HEIGHT)
+
+        return drawing
+
+    def make_drawing(self):
         # Make data matrix
         data = self.get_data()
 
@@ -361,6 +525,45 @@ class BaseMatrixChart(BaseChart):
 
 class LineChart(BaseMatrixChart):
     chart_class = OriginalLineChart
+    max_points = None # Can be None, True (chart width) or the number of points
+
+    _cache_key_attrs = BaseMatrixChart._cache_key_attrs + ('y_axis_min_value','y_axis_step_value',
+            'max_points')
+
+    def clone(self):
+        new = super(LineChart, self).clone()
+        new.max_points = self.max_points
+        return new
+
+    def get_data(self):
+        data = super(LineChart, self).get_data()
+
+        # Reduces the lines to the points that can be seen on the chart
+        self._points_indices = None
+        if data and self.max_points:
+            if self.max_points is True:
+                threshold = int(self.width)
+            else:
+                threshold = self.max_points
+
+            # Lines share the same categories, so the points kept for one
+            # line are kept for all of them
+            indices = set()
+            for line in data:
+                indices.update(largest_triangle_three_buckets(line, threshold))
+
+            if len(indices) < max(list(map(len, data))):
+                self._points_indices = sorted(indices)
+                data = [[line[num] for num in self._points_indices if num < len(line)]
+                        for line in data]
+
+        return data
+
+    def get_axis_labels_indices(self, count):
+        # Just the labels of the points kept by get_data()
+        indices = getattr(self, '_points_indices', None)
+        if indices and count > indices[-1]:
+            return indices
 
     def set_chart_attributes(self, chart):
         super(LineChart, self).set_chart_attributes(chart)
@@ -398,6 +601,8 @@ class BarChart(BaseMatrixChart):
     horizontal = False # If is not horizontal, is because it is vertical (default)
     is3d = False
 
+    _cache_key_attrs = BaseMatrixChart._cache_key_attrs + ('horizontal','is3d')
+
     def __init__(self, *args, **kwargs):
         super(BarChart, self).__init__(*args, **kwargs)
 
@@ -487,6 +692,8 @@ class PieChart(BaseChart):
     chart_class = OriginalPieChart
     slice_popout = None
 
+    _cache_key_attrs = BaseChart._cache_key_attrs + ('slice_popout',)
+
     def __init__(self, **kwargs):
         super(PieChart, self).__init__(**kwargs)
 
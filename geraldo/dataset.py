@@ -0,0 +1,301 @@
+"""Datasets shared by processes (i.e. the workers of a report pool), written
+once to a memory-mapped file in a columnar layout. Pickling a dataset pickles
+just a handle to its file, so the rows aren't pickled to every worker, and
+workers read them with no copy but of the values they get.
+
+Example:
+
+    >>> dataset = SharedDataset(rows, fields=['name', 'amount', 'customer.name'])
+    >>> pool.generate_by(MyReport, dataset, PDFGenerator, filename='test.pdf')
+    >>> pool.generate_by(MyReport, dataset[:100], PDFGenerator, filename='first.pdf')
+    >>> dataset.close()
+
+Rows are views supporting attribute and key lookups, so they are used like
+objects or dictionaries in reports. Columns of integers, floats, booleans and
+strings are stored as arrays; other values are pickled one by one."""
+
+import os, mmap, uuid, pickle, array, tempfile, threading
+
+from .utils import get_attr_value, LRUCache
+
+# Directory of dataset files. Files in shared memory if it is available
+if os.path.isdir('/dev/shm'):
+    DATASET_DIRECTORY = '/dev/shm'
+else:
+    DATASET_DIRECTORY = None
+
+# Count of dataset files kept mapped by the processes reading them
+MAPPED_DATASETS_MAX_ITEMS = 8
+
+# Column kinds, the ones of arrays are their type codes
+KIND_INT, KIND_FLOAT, KIND_BOOL, KIND_STR, KIND_OBJECT = 'q', 'd', 'b', 's', 'o'
+
+_mapped_files = LRUCache(MAPPED_DATASETS_MAX_ITEMS)
+_mapped_files_lock = threading.Lock()
+
+def get_column_kind(values):
+    """Returns the kind of the column with 'values' (None is allowed in any)"""
+    types = set(type(value) for value in values if value is not None)
+
+    if types == set([int]):
+        if all(-2**63 <= value < 2**63 for value in values if value is not None):
+            return KIND_INT
+    elif types == set([float]):
+        return KIND_FLOAT
+    elif types == set([bool]):
+        return KIND_BOOL
+    elif types == set([str]):
+        return KIND_STR
+
+    return KIND_OBJECT
+
+def get_default_fields(row):
+    """Returns the keys of a dictionary or the public attributes of an object"""
+    if isinstance(row, dict):
+        return list(row.keys())
+
+    return [name for name in vars(row) if not name.startswith('_')]
+
+def map_file(token, path):
+    """Maps a dataset file read-only, once per process"""
+    with _mapped_files_lock:
+        mapped = _mapped_files.get(token)
+
+        if mapped is None:
+            with open(path, 'rb') as fp:
+                size = os.fstat(fp.fileno()).st_size
+                mapped = size and mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ) or b''
+
+            _mapped_files.set(token, mapped)
+
+    return mapped
+
+class SharedRow(object):
+    """View of a row of a shared dataset. Its values are got as attributes or
+    keys, and dotted fields (i.e. 'customer.name') by views of their prefixes
+    (i.e. row.customer.name). Its '__dict__' has its values, as expressions
+    of ObjectValue widgets use it."""
+
+    __slots__ = ('_dataset', '_index', '_prefix')
+
+    def __init__(self, dataset, index, prefix=''):
+        self._dataset = dataset
+        self._index = index
+        self._prefix = prefix
+
+    def __getitem__(self, key):
+        name = self._prefix + key
+
+        if name in self._dataset.columns:
+            return self._dataset.get_value(name, self._index)
+        elif name in self._dataset.prefixes:
+            return SharedRow(self._dataset, self._index, name + '.')
+
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def keys(self):
+        size = len(self._prefix)
+        names = []
+
+        for field in self._dataset.fields:
+            if field.startswith(self._prefix):
+                name = field[size:].split('.')[0]
+                if name not in names:
+                    names.append(name)
+
+        return names
+
+    @property
+    def __dict__(self):
+        return dict((name, self[name]) for name in self.keys())
+
+    def __reduce__(self):
+        return (SharedRow, (self._dataset, self._index, self._prefix))
+
+    def __repr__(self):
+        return '<SharedRow %s>'%self.__dict__
+
+class SharedDataset(object):
+    """Sequence of the rows (dictionaries or objects) in 'rows', read by
+    'fields' (attribute names or paths, default: the keys or attributes of the
+    first row), stored in a memory-mapped file of 'directory' (default:
+    DATASET_DIRECTORY). Slices are datasets too, on the same file.
+
+    The process that makes a dataset must close it, deleting its file, when
+    the processes reading it don't need it anymore."""
+
+    path = None
+    fields = None
+    columns = None
+    prefixes = None
+
+    _token = None
+    _layout = None
+    _count = 0
+    _start = 0
+    _stop = 0
+    _owner = False
+
+    def __init__(self, rows, fields=None, directory=None):
+        rows = list(rows)
+        self.fields = list(fields or (rows and get_default_fields(rows[0])) or [])
+
+        fd, self.path = tempfile.mkstemp(prefix='geraldo-dataset-', suffix='.bin',
+                dir=directory or DATASET_DIRECTORY)
+        self._token = uuid.uuid4().hex
+        self._owner = True
+
+        layout = {}
+        with os.fdopen(fd, 'wb') as fp:
+            for field in self.fields:
+                layout[field] = self._write_column(fp, self.get_column_values(rows, field))
+
+        self._open(layout, len(rows), 0, len(rows))
+
+    def get_column_values(self, rows, field):
+        """Returns the values of a field of the rows. Values of dictionaries
+        are got directly when possible"""
+        if '.' not in field and all(type(row) is dict and field in row for row in rows):
+            return [row[field] for row in rows]
+
+        return [get_attr_value(row, field) for row in rows]
+
+    def _write_column(self, fp, values):
+        """Writes the arrays of a column, at 8 bytes aligned offsets, and
+        returns its kind and their offsets"""
+        def write(data):
+            fp.write(b'\0' * (-fp.tell() % 8))
+            offset = fp.tell()
+            fp.write(data)
+            return offset
+
+        kind = get_column_kind(values)
+        nulls = None
+        if kind != KIND_OBJECT and None in values:
+            nulls = write(array.array('b', [value is None for value in values]).tobytes())
+
+        if kind in (KIND_INT, KIND_FLOAT, KIND_BOOL):
+            default = kind == KIND_FLOAT and 0.0 or 0
+            data = write(array.array(kind, [default if value is None else value
+                for value in values]).tobytes())
+            return {'kind': kind, 'nulls': nulls, 'data': data}
+
+        # Strings and pickled objects are stored as bytes with their ends
+        if kind == KIND_STR:
+            items = [(value or '').encode('utf-8') for value in values]
+        else:
+            items = [pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for value in values]
+
+        ends, end = array.array('q'), 0
+        for item in items:
+            end += len(item)
+            ends.append(end)
+
+        ends = write(ends.tobytes())
+        data = write(b''.join(items))
+
+        return {'kind': kind, 'nulls': nulls, 'ends': ends, 'data': data}
+
+    def _open(self, layout, count, start, stop):
+        """Makes the column arrays on the mapped file, with no copy"""
+        self._layout, self._count = layout, count
+        self._start, self._stop = start, stop
+
+        buffer = memoryview(map_file(self._token, self.path))
+        self.columns = {}
+
+        for field, column in layout.items():
+            kind, arrays = column['kind'], {'kind': column['kind'], 'nulls': None}
+
+            if column['nulls'] is not None:
+                arrays['nulls'] = buffer[column['nulls']:column['nulls'] + count].cast('b')
+
+            if kind in (KIND_INT, KIND_FLOAT, KIND_BOOL):
+                size = array.array(kind).itemsize
+                arrays['data'] = buffer[column['data']:column['data'] + count * size].cast(kind)
+            else:
+                arrays['ends'] = buffer[column['ends']:column['ends'] + count * 8].cast('q')
+                arrays['data'] = buffer[column['data']:]
+
+            self.columns[field] = arrays
+
+        self.prefixes = set()
+        for field in self.fields:
+            parts = field.split('.')
+            self.prefixes.update(['.'.join(parts[:num]) for num in range(1, len(parts))])
+
+    def get_value(self, field, index):
+        """Returns the value of a field in the row at 'index' of the file"""
+        column = self.columns[field]
+
+        if column['nulls'] is not None and column['nulls'][index]:
+            return None
+
+        kind = column['kind']
+        if kind in (KIND_INT, KIND_FLOAT):
+            return column['data'][index]
+        elif kind == KIND_BOOL:
+            return bool(column['data'][index])
+
+        ends = column['ends']
+        data = column['data'][index and ends[index - 1] or 0:ends[index]]
+
+        if kind == KIND_STR:
+            return str(data, 'utf-8')
+
+        return pickle.loads(data)
+
+    def close(self):
+        """Deletes the file of the dataset, if this process made it. Processes
+        with the file mapped can still read it."""
+        if self._owner and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('Slices of datasets must be contiguous')
+
+            view = object.__new__(SharedDataset)
+            view.path, view.fields, view._token = self.path, self.fields, self._token
+            view.columns, view.prefixes = self.columns, self.prefixes
+            view._layout, view._count = self._layout, self._count
+            view._start, view._stop = self._start + start, self._start + max(start, stop)
+            return view
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Dataset index out of range')
+
+        return SharedRow(self, self._start + index)
+
+    def __iter__(self):
+        for index in range(self._start, self._stop):
+            yield SharedRow(self, index)
+
+    def __getstate__(self):
+        """Just the handle to the file is pickled"""
+        return {'path': self.path, 'fields': self.fields, 'token': self._token,
+                'layout': self._layout, 'count': self._count, 'start': self._start,
+                'stop': self._stop}
+
+    def __setstate__(self, state):
+        self.path, self.fields, self._token = state['path'], state['fields'], state['token']
+        self._open(state['layout'], state['count'], state['start'], state['stop'])
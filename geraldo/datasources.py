@@ -0,0 +1,493 @@
+"""Data sources usable as querysets of reports, streaming their rows instead
+of having them fetched in lists first.
+
+Example:
+
+    >>> import sqlite3
+    >>> connection = sqlite3.connect('sales.db')
+    >>> queryset = SQLDataSource(connection, 'select region, customer, amount from sale '
+    ...     'where year = ? order by region', params=(2020,))
+    >>> MyReport(queryset=queryset).generate_by(PDFGenerator, filename='sales.pdf')
+
+    >>> queryset = CSVDataSource('sales.csv', converters={'amount': Decimal})
+    >>> MyReport(queryset=queryset).generate_by(PDFGenerator, filename='sales.pdf')
+
+Rows are records backed by tuples, with values got as attributes or keys by
+column names. Aggregations of ObjectValue widgets (i.e. sums in group footers)
+are computed by SQL GROUP BY queries. Rows of files (CSV, JSON Lines and fixed
+width) are read while they are iterated, and their values are decoded just
+when they are got, so the columns not shown aren't decoded."""
+
+import os, csv, json, mmap
+
+from .utils import FIELD_ACTION_COUNT, FIELD_ACTION_AVG, FIELD_ACTION_MIN, FIELD_ACTION_MAX,\
+        FIELD_ACTION_SUM, FIELD_ACTION_DISTINCT_COUNT
+
+# Rows fetched by each 'fetchmany' call
+DEFAULT_BATCH_SIZE = 500
+
+# SQL expressions of the aggregations, the same of the ObjectValue actions
+SQL_AGGREGATES = {
+    FIELD_ACTION_COUNT: 'COUNT(%s)',
+    FIELD_ACTION_SUM: 'SUM(%s)',
+    FIELD_ACTION_AVG: 'AVG(COALESCE(%s, 0))',
+    FIELD_ACTION_MIN: 'MIN(%s)',
+    FIELD_ACTION_MAX: 'MAX(%s)',
+    FIELD_ACTION_DISTINCT_COUNT: 'COUNT(DISTINCT %s)',
+    }
+
+class Record(object):
+    """Row of a data source, backed by a tuple. Its values are got as
+    attributes or keys by the names in 'indexes' (a dictionary with their
+    positions, shared by the rows of the same data source). Its '__dict__' has
+    its values, as expressions of ObjectValue widgets use it."""
+
+    __slots__ = ('_indexes', '_values')
+
+    def __init__(self, indexes, values):
+        self._indexes = indexes
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._indexes[key]]
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._indexes[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def keys(self):
+        return sorted(self._indexes, key=self._indexes.get)
+
+    @property
+    def __dict__(self):
+        return dict((name, self._values[index]) for name, index in self._indexes.items())
+
+    def __reduce__(self):
+        return (Record, (self._indexes, self._values))
+
+    def __repr__(self):
+        return '<Record %s>'%self.__dict__
+
+class SQLDataSource(object):
+    """Rows of the query 'sql' (with 'params') on the DB-API 'connection',
+    fetched in batches of 'batch_size' rows while they are iterated. Each
+    iteration executes the query by a new cursor. The cursor of an emptiness
+    test is kept for the next iteration, or until 'close()'.
+
+    Aggregations of ObjectValue widgets on columns of the query, grouped by
+    columns, are computed by a SQL GROUP BY query each, run once for all the
+    groups of a generation, instead of reading the rows again. Set
+    'aggregates_by_sql' to False to compute them from the rows."""
+
+    connection = None
+    sql = None
+    params = None
+    batch_size = DEFAULT_BATCH_SIZE
+    aggregates_by_sql = True
+
+    _columns = None
+    _aggregates = None
+    _pending = None
+
+    def __init__(self, connection, sql, params=None, batch_size=None, aggregates_by_sql=None):
+        self.connection = connection
+        self.sql = sql
+        self.params = params or ()
+        self.batch_size = batch_size or self.batch_size
+        if aggregates_by_sql is not None:
+            self.aggregates_by_sql = aggregates_by_sql
+
+        self._aggregates = {}
+
+    def execute(self, sql=None):
+        """Returns a new cursor executing 'sql' (default: the query), with
+        the query params"""
+        cursor = self.connection.cursor()
+        cursor.execute(sql or self.sql, self.params)
+        return cursor
+
+    def get_columns(self):
+        """Returns the column names of the query, from the description of a
+        cursor executing it with no rows"""
+        if self._columns is None:
+            cursor = self.execute('SELECT * FROM (%s) geraldo_rows WHERE 1=0'%self.sql)
+            try:
+                self._columns = [column[0] for column in cursor.description]
+            finally:
+                cursor.close()
+
+        return self._columns
+
+    def quote_name(self, name):
+        """Returns a column name quoted for SQL. ANSI double quotes by default,
+        override it for databases using others"""
+        return '"%s"'%name.replace('"', '""')
+
+    def __iter__(self):
+        # Aggregates are computed again for every generation
+        self._aggregates = {}
+
+        # Continues the cursor of the latest emptiness test, if any
+        if self._pending is not None:
+            (cursor, first_row), self._pending = self._pending, None
+            rows = [first_row]
+        else:
+            cursor, rows = self.execute(), []
+
+        try:
+            self._columns = [column[0] for column in cursor.description]
+            indexes = dict((name, index) for index, name in enumerate(self._columns))
+
+            while True:
+                rows.extend(cursor.fetchmany(self.batch_size))
+                if not rows:
+                    break
+
+                for row in rows:
+                    yield Record(indexes, tuple(row))
+
+                rows = []
+        finally:
+            cursor.close()
+
+    def __bool__(self):
+        """Executes the query to know if it has rows. The cursor is kept, to be
+        read by the next iteration, as reports are tested for emptiness just
+        before being generated."""
+        if self._pending is None:
+            cursor = self.execute()
+            row = cursor.fetchone()
+            if row is None:
+                cursor.close()
+                return False
+
+            self._pending = (cursor, row)
+
+        return True
+
+    def close(self):
+        """Closes the cursor kept by the latest emptiness test, if it was not
+        read by an iteration"""
+        if self._pending is not None:
+            (cursor, first_row), self._pending = self._pending, None
+            cursor.close()
+
+    def __del__(self):
+        self.close()
+
+    # Aggregates
+
+    def can_aggregate(self, action, attribute_name, group_names):
+        """Returns True if an aggregation of a column grouped by columns can be
+        computed by SQL"""
+        if not self.aggregates_by_sql or action not in SQL_AGGREGATES:
+            return False
+
+        columns = self.get_columns()
+        return attribute_name in columns and all(name in columns for name in group_names)
+
+    def get_aggregate(self, action, attribute_name, group_names, group_values):
+        """Returns the aggregation of a column for the rows with 'group_values'
+        in the columns 'group_names'. The aggregation of all the groups is
+        computed by one GROUP BY query, the first time."""
+        key = (action, attribute_name, tuple(group_names))
+
+        if key not in self._aggregates:
+            names = [self.quote_name(name) for name in group_names]
+            sql = 'SELECT %s FROM (%s) geraldo_rows'%(', '.join(names +
+                [SQL_AGGREGATES[action]%self.quote_name(attribute_name)]), self.sql)
+            if names:
+                sql += ' GROUP BY %s'%', '.join(names)
+
+            cursor = self.execute(sql)
+            try:
+                self._aggregates[key] = dict((tuple(row[:-1]), row[-1])
+                        for row in cursor.fetchall())
+            finally:
+                cursor.close()
+
+        default = action in (FIELD_ACTION_COUNT, FIELD_ACTION_DISTINCT_COUNT) and 0 or None
+        return self._aggregates[key].get(tuple(group_values), default)
+
+class LazyRecord(object):
+    """Row of a file data source, with its values decoded just when they are
+    got (once) by the method 'decode_value' of the data source, from the raw
+    row. Its values are got as attributes or keys, and its '__dict__' has all
+    of them, as expressions of ObjectValue widgets use it."""
+
+    __slots__ = ('_source', '_raw', '_values')
+
+    def __init__(self, source, raw):
+        self._source = source
+        self._raw = raw
+        self._values = None
+
+    def __getitem__(self, key):
+        if self._values is None:
+            self._values = {}
+        elif key in self._values:
+            return self._values[key]
+
+        value = self._values[key] = self._source.decode_value(self._raw, key)
+        return value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def keys(self):
+        return list(self._source.fields)
+
+    @property
+    def __dict__(self):
+        return dict((name, self[name]) for name in self.keys())
+
+    def __reduce__(self):
+        return (self.__class__, (self._source, self._raw))
+
+    def __repr__(self):
+        return '<%s %s>'%(self.__class__.__name__, self.__dict__)
+
+class JSONRecord(LazyRecord):
+    """Row of a JSON Lines data source. Its line is parsed when its first
+    value is got."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(self._raw, bytes):
+            self._raw = json.loads(self._raw)
+
+        return super(JSONRecord, self).__getitem__(key)
+
+    def keys(self):
+        if isinstance(self._raw, bytes):
+            self._raw = json.loads(self._raw)
+
+        return list(self._raw.keys())
+
+class FileDataSource(object):
+    """Base class of data sources reading the rows of the file 'filename' each
+    time they are iterated. Values of the fields in the dictionary
+    'converters' are converted by their functions (i.e. Decimal or int) when
+    they are got, and empty ones are None."""
+
+    filename = None
+    encoding = 'utf-8'
+    fields = None
+    converters = None
+    record_class = LazyRecord
+
+    def __init__(self, filename, fields=None, converters=None, encoding=None):
+        self.filename = filename
+        self.fields = fields and list(fields) or self.fields
+        self.converters = converters or {}
+        self.encoding = encoding or self.encoding
+
+    def convert(self, name, text):
+        """Returns the value of a field from its text"""
+        converter = self.converters.get(name)
+        if converter is None:
+            return text
+        elif not text:
+            return None
+
+        return converter(text)
+
+    def decode_value(self, raw, name):
+        """Returns the value of the field 'name' from a raw row. It must raise
+        KeyError if there is no field with that name."""
+        raise Exception('Not implemented')
+
+    def iter_raw_rows(self):
+        """Yields the raw rows of the file"""
+        raise Exception('Not implemented')
+
+    def __iter__(self):
+        record_class = self.record_class
+        for raw in self.iter_raw_rows():
+            yield record_class(self, raw)
+
+    def __bool__(self):
+        rows = self.iter_raw_rows()
+        try:
+            return next(rows, None) is not None
+        finally:
+            rows.close()
+
+class CSVDataSource(FileDataSource):
+    """Rows of a CSV file, with the field names of its first row, unless
+    'has_header' is False. Names in 'fields' replace them. Other arguments
+    are formatting parameters of csv.reader (i.e. delimiter)."""
+
+    has_header = True
+
+    _indexes = None
+
+    def __init__(self, filename, fields=None, converters=None, encoding=None, has_header=None,
+            **fmtparams):
+        super(CSVDataSource, self).__init__(filename, fields, converters, encoding)
+
+        if has_header is not None:
+            self.has_header = has_header
+        self.fmtparams = fmtparams
+
+        if self.fields is None:
+            if not self.has_header:
+                raise ValueError('Fields must be informed for CSV files with no header')
+
+            with open(self.filename, newline='', encoding=self.encoding) as fp:
+                self.fields = next(csv.reader(fp, **self.fmtparams), [])
+
+        self._indexes = dict((name, index) for index, name in enumerate(self.fields))
+
+    def decode_value(self, raw, name):
+        index = self._indexes[name]
+        return self.convert(name, index < len(raw) and raw[index] or '')
+
+    def iter_raw_rows(self):
+        with open(self.filename, newline='', encoding=self.encoding) as fp:
+            reader = csv.reader(fp, **self.fmtparams)
+            if self.has_header:
+                next(reader, None)
+
+            for row in reader:
+                if row:
+                    yield row
+
+class JSONLinesDataSource(FileDataSource):
+    """Rows of a JSON Lines file (an object by line). Each row is parsed when
+    its first value is got, so the rows not shown aren't parsed."""
+
+    record_class = JSONRecord
+
+    def decode_value(self, raw, name):
+        value = raw[name]
+        if isinstance(value, str):
+            return self.convert(name, value)
+
+        return value
+
+    def iter_raw_rows(self):
+        with open(self.filename, 'rb') as fp:
+            for line in fp:
+                if line.strip():
+                    yield line
+
+def is_single_byte_encoding(encoding):
+    """Returns True if every character 'encoding' encodes takes one byte"""
+    return all(len(char.encode(encoding, 'ignore')) <= 1 for char in '\xe9\u20ac\u4e00\uac00')
+
+class FixedWidthDataSource(FileDataSource):
+    """Rows of a file with fixed width fields and lines of the same length,
+    mapped in memory. 'fields' is a list of tuples with name and width of each
+    field, in their order in the lines, and their offsets are computed once.
+    Values are decoded from their slices of the line, with spaces stripped.
+    The first 'skip_lines' lines are skipped (i.e. headers), and they can
+    have other lengths.
+
+    Widths and lines lengths are in bytes, so the encoding must take a byte by
+    character (default: 'latin-1'). Rows are got by index too, as they are at
+    known positions in the file."""
+
+    encoding = 'latin-1'
+    skip_lines = 0
+
+    _offsets = None
+    _mapped = None
+    _line_size = 0
+    _start = 0
+    _count = 0
+
+    def __init__(self, filename, fields, converters=None, encoding=None, skip_lines=None):
+        super(FixedWidthDataSource, self).__init__(filename, None, converters, encoding)
+
+        if not is_single_byte_encoding(self.encoding):
+            raise ValueError('Fixed width files must have an encoding taking a byte by '
+                    'character, not %s'%self.encoding)
+
+        if skip_lines is not None:
+            self.skip_lines = skip_lines
+
+        self.fields, self._offsets, offset = [], {}, 0
+        for name, width in fields:
+            self.fields.append(name)
+            self._offsets[name] = (offset, offset + width)
+            offset += width
+
+        self.open()
+
+    def open(self):
+        """Maps the file and computes the line size from its first line after
+        the skipped ones"""
+        with open(self.filename, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            mapped = self._mapped = size and mmap.mmap(fp.fileno(), size,
+                    access=mmap.ACCESS_READ) or b''
+
+        start = 0
+        for num in range(self.skip_lines):
+            end = mapped.find(b'\n', start)
+            start = end >= 0 and end + 1 or size
+
+        end = mapped.find(b'\n', start)
+        if end >= 0:
+            line_size = end + 1 - start
+            line_break = mapped[end - 1:end] == b'\r' and end > start and 2 or 1
+        else:
+            line_size, line_break = size - start, 0
+
+        # The last line can have no line break
+        data_size = size - start
+        if line_size and data_size % line_size and (data_size + line_break) % line_size:
+            raise ValueError('Lines of %s have not the same length (%d bytes)'%(
+                self.filename, line_size))
+
+        if max([end for start, end in self._offsets.values()] or [0]) > line_size - line_break:
+            raise ValueError('Fields are wider than the lines of %s (%d bytes)'%(
+                self.filename, line_size - line_break))
+
+        self._line_size, self._start = line_size, start
+        self._count = line_size and (data_size + line_size - 1) // line_size or 0
+
+    def close(self):
+        """Unmaps the file"""
+        if isinstance(self._mapped, mmap.mmap):
+            self._mapped.close()
+
+    def decode_value(self, raw, name):
+        start, end = self._offsets[name]
+        text = self._mapped[raw + start:raw + end].decode(self.encoding).strip()
+        return self.convert(name, text)
+
+    def iter_raw_rows(self):
+        for index in range(self._count):
+            yield self._start + index * self._line_size
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('Data source index out of range')
+
+        return LazyRecord(self, self._start + index * self._line_size)
+
+    def __getstate__(self):
+        """The file is mapped again when unpickled (i.e. by workers of a pool)"""
+        state = self.__dict__.copy()
+        state.pop('_mapped', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open()
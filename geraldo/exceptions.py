@@ -17,3 +17,19 @@ class AbortEvent(Exception):
     """Exception class used inside event methods to abort that printing/rendering"""
     pass
 
+
+class PoolTimeout(Exception):
+    """Exception class raised when a job of a report pool exceeds its timeout"""
+    pass
+
+class PoolWorkerError(Exception):
+    """Exception class raised when a worker process of a report pool fails"""
+    pass
+
+class PoolClosed(PoolWorkerError):
+    """Exception class raised when a job is submitted to a closed report pool"""
+    pass
+
+class PipelineError(Exception):
+    """Exception class raised when the layout process of a pipeline fails"""
+    pass
@@ -1,18 +1,41 @@
-import random, shelve, os
+import random, shelve, os, bisect, math, itertools, copy, io, pickle, types, threading,\
+        multiprocessing, warnings
 from decimal import Decimal
 
-from geraldo.utils import get_attr_value, calculate_size, memoize
-from geraldo.widgets import Widget, Label, SystemField
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from geraldo.utils import get_attr_value, calculate_size, memoize, LRUCache,\
+        PrefetchingReader
+from geraldo.widgets import Widget, Label, SystemField, ObjectValue
 from geraldo.graphics import Graphic, RoundRect, Rect, Line, Circle, Arc,\
         Ellipse, Image
 from geraldo.barcodes import BarCode
-from geraldo.base import GeraldoObject, ManyElements
+from geraldo.base import GeraldoObject, ManyElements, ReportBand, BaseReport
 from geraldo.cache import CACHE_BY_QUERYSET, CACHE_BY_RENDER, CACHE_DISABLED,\
-        make_hash_key, get_cache_backend
+        make_hash_key, make_objects_reprs, get_cache_backend
 from geraldo.charts import BaseChart
-from geraldo.exceptions import AbortEvent
+from geraldo.exceptions import AbortEvent, PipelineError
 import collections
 
+WRAP_CACHE_MAX_ITEMS = 2000
+PAGE_CHECKPOINTS_MAX_ITEMS = 100
+INCREMENTAL_LAYOUTS_MAX_ITEMS = 10
+
+# Layout checkpoints by generator class and report data (see page_range)
+page_checkpoints = LRUCache(PAGE_CHECKPOINTS_MAX_ITEMS)
+
+# Latest layout by generator class and report (see incremental)
+incremental_layouts = LRUCache(INCREMENTAL_LAYOUTS_MAX_ITEMS)
+
+# Layout processes of pipelines are forked, to have the same report objects
+if 'fork' in multiprocessing.get_all_start_methods():
+    PIPELINE_START_METHOD = 'fork'
+else:
+    PIPELINE_START_METHOD = None
+
 class ReportPage(GeraldoObject):
     rect = None
     _elements = None
@@ -44,6 +67,105 @@ class ReportPage(GeraldoObject):
         return '/'.join([el.repr_for_cache_hash_key() for el in self.elements
             if hasattr(el, 'repr_for_cache_hash_key')])
 
+class PagePlan(object):
+    """Page boundaries of a report, calculated by ReportGenerator.plan_pages
+    from band heights, with no rendering. Pages are numbered from 1 and each
+    one has the index of its first object and the count of objects having
+    their detail band on it."""
+
+    pages = None
+    objects_count = 0
+
+    def __init__(self, pages, objects_count):
+        self.pages = pages
+        self.objects_count = objects_count
+        self._first_objects = [first for first, count in pages]
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+    def get_page_objects(self, page_number):
+        """Returns the range of object indices rendered on a page"""
+        first, count = self.pages[page_number - 1]
+        return range(first, first + count)
+
+    def get_object_page(self, index):
+        """Returns the number of the page where an object is rendered"""
+        if not 0 <= index < self.objects_count:
+            raise IndexError('There is no object with index %s'%index)
+
+        # Pages with no objects (i.e. with just group footers) share the first
+        # object with the next ones, so the latest one is taken
+        return bisect.bisect_right(self._first_objects, index)
+
+    def split(self, count):
+        """Splits the pages in up to 'count' sequential shards with balanced
+        objects count, to be rendered in parallel. Returns a list of tuples with
+        first and last page numbers."""
+        shards = []
+        first_page = 1
+        per_shard = float(self.objects_count) / max(count, 1)
+
+        for page_number in range(1, self.page_count + 1):
+            first, objects = self.pages[page_number - 1]
+            shard_limit = per_shard * (len(shards) + 1)
+
+            if page_number == self.page_count or (len(shards) < count - 1 and
+                    first + objects >= shard_limit):
+                shards.append((first_page, page_number))
+                first_page = page_number + 1
+
+        return shards
+
+class PagePickler(pickle.Pickler):
+    """Pickles laid out pages to send them to the drawing process of a
+    pipeline. Objects both processes have since the fork (in 'shared') are
+    pickled as their indices, so just the elements made by the layout go
+    through the pipe."""
+
+    def __init__(self, file, shared):
+        super(PagePickler, self).__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.shared_ids = dict((id(obj), index) for index, obj in enumerate(shared))
+
+    def persistent_id(self, obj):
+        index = self.shared_ids.get(id(obj))
+        if index is not None:
+            return index
+
+        # Functions declared in classes are bound again on every access
+        if isinstance(obj, types.MethodType) and id(obj.__self__) in self.shared_ids\
+           and id(obj.__func__) in self.shared_ids:
+            return (self.shared_ids[id(obj.__self__)], self.shared_ids[id(obj.__func__)])
+
+        return None
+
+class PageUnpickler(pickle.Unpickler):
+    """Unpickles pages pickled by PagePickler with the same 'shared' objects"""
+
+    def __init__(self, file, shared):
+        super(PageUnpickler, self).__init__(file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        if isinstance(pid, tuple):
+            return types.MethodType(self.shared[pid[1]], self.shared[pid[0]])
+
+        return self.shared[pid]
+
+class PreviewPageCount(int):
+    """Page count of a preview stopped before the latest page. It is an
+    estimate from the objects per page or, if 'minimum' is True, just the count
+    of rendered pages, shown with a plus sign (i.e. '2+')"""
+
+    minimum = False
+
+    def __str__(self):
+        if self.minimum:
+            return '%d+'%self
+
+        return int.__str__(self)
+
 class ReportGenerator(GeraldoObject):
     """A report generator is used to generate a report to a specific format."""
 
@@ -51,6 +173,24 @@ class ReportGenerator(GeraldoObject):
     first_page_number = 1
     variables = None
     return_pages = False
+    prefetch_images = 0 # Count of next objects to load images of in background
+    prefetch_workers = 4
+    prefetch_objects = 0 # Size of batches of objects fetched by a thread while laying out
+    prefetch_batches = 2 # Count of batches of objects fetched ahead
+    page_range = None # Tuple with first and last page numbers to generate
+    preview_pages = None # Count of first pages to render, for previews
+    incremental = False # Reuses pages of the latest layout for unchanged objects
+    stream_pages = False # Generates pages as they are laid out, releasing them
+    pipeline = False # Lays out pages in a forked process while this one generates them (see can_pipeline)
+
+    wrap_cache = None # Wrapped paragraphs by text, style and dimensions
+    _static_key = None
+    _prepared_elements = None
+    _page_count = None
+    _checkpoints = None
+    _objects_iterator = None
+    _previous_layout = None
+    _streamed_pages_count = 0
 
     _is_first_page = True
     _is_latest_page = True
@@ -73,8 +213,16 @@ class ReportGenerator(GeraldoObject):
     _rendered_pages = None
     _page_rect = None
 
+    # Images prefetching
+    _prefetch_executor = None
+    _prefetch_elements = None
+    _prefetched_images = None
+    _prefetch_next_index = 0
+
     def __init__(self, report, first_page_number=1, variables=None, return_pages=False,
-            pages=None, **kwargs):
+            pages=None, prefetch_images=None, page_range=None, preview_pages=None,
+            incremental=None, stream_pages=None, page_count=None, prefetch_objects=None,
+            pipeline=None, **kwargs):
         """This method should be overrided to receive others arguments"""
         self.report = report
 
@@ -86,10 +234,44 @@ class ReportGenerator(GeraldoObject):
         self._groups_changed = {}
         self._groups_stack = []
 
+        # Reports bound to a prepared report share its caches
+        if getattr(report, 'prepared', None):
+            self._prepared_elements = report.prepared.get_generator_cache(self.__class__, 'elements')
+            self.wrap_cache = report.prepared.get_generator_cache(self.__class__, 'wrap',
+                    lambda: LRUCache(WRAP_CACHE_MAX_ITEMS))
+        else:
+            self._prepared_elements = {}
+            self.wrap_cache = LRUCache(WRAP_CACHE_MAX_ITEMS)
+
         self.first_page_number = first_page_number
         self.variables = variables or self.variables or {}
         self.return_pages = return_pages
 
+        if prefetch_images is not None:
+            self.prefetch_images = prefetch_images
+
+        if prefetch_objects is not None:
+            self.prefetch_objects = prefetch_objects
+
+        if page_range is not None:
+            self.page_range = page_range
+
+        if preview_pages is not None:
+            self.preview_pages = preview_pages
+
+        if incremental is not None:
+            self.incremental = incremental
+
+        if stream_pages is not None:
+            self.stream_pages = stream_pages
+
+        if pipeline is not None:
+            self.pipeline = pipeline
+
+        # Page count of a document this report is part of
+        if page_count is not None:
+            self._page_count = page_count
+
     def get_children(self):
         return self._rendered_pages
 
@@ -103,7 +285,7 @@ class ReportGenerator(GeraldoObject):
         """Renders a border in the coordinates setted in the rect."""
         b_all = borders_dict.get('all', None)
         if b_all:
-            graphic = isinstance(b_all, Graphic) and b_all or Rect()
+            graphic = isinstance(b_all, Graphic) and b_all.clone() or Rect()
             graphic.set_rect(
                     left=rect_dict['left'],
                     top=rect_dict['top'] - rect_dict['height'],
@@ -114,11 +296,12 @@ class ReportGenerator(GeraldoObject):
             if isinstance(b_all, (int, float)):
                 graphic.stroke_width = b_all
 
+            graphic.static_key = self._static_key
             self._rendered_pages[-1].add_element(graphic)
 
         b_left = borders_dict.get('left', None)
         if b_left:
-            graphic = isinstance(b_left, Graphic) and b_left or Line()
+            graphic = isinstance(b_left, Graphic) and b_left.clone() or Line()
             graphic.set_rect(
                     left=rect_dict['left'], top=rect_dict['top'],
                     right=rect_dict['left'], bottom=rect_dict['bottom']
@@ -127,11 +310,12 @@ class ReportGenerator(GeraldoObject):
             if isinstance(b_left, (int, float)):
                 graphic.stroke_width = b_left
 
+            graphic.static_key = self._static_key
             self._rendered_pages[-1].add_element(graphic)
 
         b_top = borders_dict.get('top', None)
         if b_top:
-            graphic = isinstance(b_top, Graphic) and b_top or Line()
+            graphic = isinstance(b_top, Graphic) and b_top.clone() or Line()
             graphic.set_rect(
                     left=rect_dict['left'], top=rect_dict['top'],
                     right=rect_dict['right'], bottom=rect_dict['top']
@@ -140,11 +324,12 @@ class ReportGenerator(GeraldoObject):
             if isinstance(b_top, (int, float)):
                 graphic.stroke_width = b_top
 
+            graphic.static_key = self._static_key
             self._rendered_pages[-1].add_element(graphic)
 
         b_right = borders_dict.get('right', None)
         if b_right:
-            graphic = isinstance(b_right, Graphic) and b_right or Line()
+            graphic = isinstance(b_right, Graphic) and b_right.clone() or Line()
             graphic.set_rect(
                     left=rect_dict['right'], top=rect_dict['top'],
                     right=rect_dict['right'], bottom=rect_dict['bottom']
@@ -153,11 +338,12 @@ class ReportGenerator(GeraldoObject):
             if isinstance(b_right, (int, float)):
                 graphic.stroke_width = b_right
 
+            graphic.static_key = self._static_key
             self._rendered_pages[-1].add_element(graphic)
 
         b_bottom = borders_dict.get('bottom', None)
         if b_bottom:
-            graphic = isinstance(b_right, Graphic) and b_right or Line()
+            graphic = isinstance(b_bottom, Graphic) and b_bottom.clone() or Line()
             graphic.set_rect(
                     left=rect_dict['left'], top=rect_dict['bottom'],
                     right=rect_dict['right'], bottom=rect_dict['bottom']
@@ -166,6 +352,7 @@ class ReportGenerator(GeraldoObject):
             if isinstance(b_bottom, (int, float)):
                 graphic.stroke_width = b_bottom
 
+            graphic.static_key = self._static_key
             self._rendered_pages[-1].add_element(graphic)
 
     def make_band_rect(self, band, top_position, left_position):
@@ -173,7 +360,7 @@ class ReportGenerator(GeraldoObject):
         band_rect = {
                 'left': left_position, #self.report.margin_left,
                 'top': top_position,
-                'right': left_position + self.calculate_size(band.width), #self.report.page_size[0] - self.report.margin_right,
+                'right': left_position + self.get_band_width(band), #self.report.page_size[0] - self.report.margin_right,
                 'bottom': top_position - self.calculate_size(band.height),
                 'height': self.calculate_size(band.height),
                 }
@@ -199,7 +386,8 @@ class ReportGenerator(GeraldoObject):
 
         # Widget element
         if isinstance(element, Widget):
-            widget = element.clone()
+            prepared = self.prepare_element(element, band)
+            widget = self.clone_element(element, prepared)
 
             # Set widget colors
             widget.font_color = self.report.default_font_color
@@ -211,6 +399,13 @@ class ReportGenerator(GeraldoObject):
             widget.band = band # This should be done by a metaclass in Band domain TODO
             widget.page = self._rendered_pages[-1]
 
+            # Elements rendered the same way for every object
+            if prepared['static']:
+                widget.static_source = prepared['key']
+
+                if self._static_key:
+                    widget.static_key = self._static_key
+
             # Border rect
             widget_rect = self.make_widget_rect(widget, band_rect)
 
@@ -219,10 +414,21 @@ class ReportGenerator(GeraldoObject):
                 widget.top = self.calculate_top(temp_top, self.calculate_size(widget.top))
 
                 temp_height = self.calculate_size(element.top) + self.calculate_size(widget.height)
-            elif isinstance(widget, Label):
-                para = self.make_paragraph(widget.text, self.make_paragraph_style(band, widget.style))
+            elif isinstance(widget, Label) and prepared['static'] and not widget.truncate_overflow:
+                # Static labels are measured just once
+                if prepared['height'] is None:
+                    para = self.make_paragraph(widget.text, self.make_paragraph_style(band, widget.style))
+                    self.wrap_paragraph_on(para, self.calculate_size(widget.width), self.calculate_size(widget.height))
+                    prepared['height'] = para.height
+
+                para_height = prepared['height']
+                widget.left = band_rect['left'] + self.calculate_size(widget.left)
+                widget.top = self.calculate_top(temp_top, self.calculate_size(widget.top), self.calculate_size(para_height))
 
+                temp_height = self.calculate_size(element.top) + self.calculate_size(para_height)
+            elif isinstance(widget, Label):
                 if widget.truncate_overflow:
+                    para = self.make_paragraph(widget.text, self.make_paragraph_style(band, widget.style))
                     self.keep_in_frame(
                             widget,
                             self.calculate_size(widget.width),
@@ -234,7 +440,8 @@ class ReportGenerator(GeraldoObject):
                     widget.left = band_rect['left'] + self.calculate_size(widget.left)
                     widget.top = self.calculate_top(temp_top, self.calculate_size(widget.top), self.calculate_size(widget.height))
                 else:
-                    self.wrap_paragraph_on(para, self.calculate_size(widget.width), self.calculate_size(widget.height))
+                    para = self.get_wrapped_paragraph(widget.text, band, widget.style,
+                            self.calculate_size(widget.width), self.calculate_size(widget.height))
                     widget.left = band_rect['left'] + self.calculate_size(widget.left)
                     widget.top = self.calculate_top(temp_top, self.calculate_size(widget.top), self.calculate_size(para.height))
 
@@ -253,7 +460,9 @@ class ReportGenerator(GeraldoObject):
 
         # Graphic element
         elif isinstance(element, Graphic):
-            graphic = element.clone()
+            prepared = self.prepare_element(element, band)
+            graphic = self.get_prefetched_image(element, current_object) or\
+                    self.clone_element(element, prepared)
 
             # Set widget basic attributes
             graphic.instance = current_object
@@ -262,6 +471,13 @@ class ReportGenerator(GeraldoObject):
             graphic.band = band # This should be done by a metaclass in Band domain TODO
             graphic.page = self._rendered_pages[-1]
 
+            # Elements rendered the same way for every object
+            if prepared['static']:
+                graphic.static_source = prepared['key']
+
+                if self._static_key:
+                    graphic.static_key = self._static_key
+
             # Set graphic colors
             graphic.fill_color = graphic.fill_color or self.report.default_fill_color
             graphic.stroke_color = graphic.stroke_color or self.report.default_stroke_color
@@ -311,6 +527,8 @@ class ReportGenerator(GeraldoObject):
 
         # Many elements
         elif isinstance(element, ManyElements):
+            element = copy.copy(element) # Bands are shared by generations
+
             # Set widget basic attributes
             element.instance = current_object
             element.generator = self
@@ -341,8 +559,8 @@ class ReportGenerator(GeraldoObject):
         self._rendered_pages[-1].width = self.calculate_size(self.report.page_size[0]) -\
                 self.calculate_size(self.report.margin_left) - self.calculate_size(self.report.margin_right)
 
-        # Default value for band width
-        band.width = self.calculate_size(band.width) or self._rendered_pages[-1].width
+        # Bands aren't changed, as they can be shared by concurrent generations
+        band_width = self.get_band_width(band)
 
         # Coordinates
         left_position = left_position or self.get_left_pos()
@@ -350,7 +568,7 @@ class ReportGenerator(GeraldoObject):
         # Increases the top position when being an inline displayed detail band
         if left_position > self.calculate_size(self.report.margin_left) and\
            getattr(band, 'display_inline', False) and\
-           band.width < self.get_available_width():
+           band_width < self.get_available_width():
             temp_height = band.height + getattr(band, 'margin_top', 0) + getattr(band, 'margin_bottom', 0)
             self.update_top_pos(decrease=self.calculate_size(temp_height))
         else:
@@ -362,6 +580,12 @@ class ReportGenerator(GeraldoObject):
         # Calculates the band dimensions on the canvas
         band_rect = self.make_band_rect(band, top_position, left_position)
 
+        # Page header and footer are drawn at the same position on every page
+        if band is self.report.band_page_header and self.is_static_band(band):
+            self._static_key = 'page_header'
+        elif band is self.report.band_page_footer and self.is_static_band(band):
+            self._static_key = 'page_footer'
+
         # Band borders
         self.render_border(band.borders, band_rect)
 
@@ -373,6 +597,8 @@ class ReportGenerator(GeraldoObject):
             self.render_element(element, current_object, band, band_rect, temp_top,
                     top_position)
 
+        self._static_key = None
+
         # Updates top position
         if update_top:
             if band.auto_expand_height:
@@ -387,7 +613,7 @@ class ReportGenerator(GeraldoObject):
 
         # Updates left position
         if getattr(band, 'display_inline', False):
-            self.update_left_pos(band.width + self.calculate_size(getattr(band, 'margin_right', 0)))
+            self.update_left_pos(band_width + self.calculate_size(getattr(band, 'margin_right', 0)))
         else:
             self.update_left_pos(set_position=0)
 
@@ -443,7 +669,9 @@ class ReportGenerator(GeraldoObject):
                 self._page_rect['top'] = self.calculate_size(self.report.page_size[1]) - self._page_rect['top']
                 self._page_rect['bottom'] = self.calculate_size(self.report.page_size[1]) - self._page_rect['bottom']
 
+            self._static_key = 'page_borders'
             self.render_border(self.report.borders, self._page_rect)
+            self._static_key = None
 
         # Page footer
         self.render_page_footer()
@@ -512,6 +740,83 @@ class ReportGenerator(GeraldoObject):
                 update_top=False,
                 )
 
+    def is_static_band(self, band):
+        """Returns True if a page band is rendered at the same position with
+        the same elements on every page, so its page-invariant elements can be
+        drawn just once by generators supporting it"""
+        return bool(self.report.reuse_static_bands and not self.report.on_new_page and
+                not band.child_bands and not self.band_has_events(band))
+
+    def band_has_events(self, band):
+        """Returns True if a band or its elements have events, that could
+        change the elements while rendering. Events of elements created by
+        ManyElements are in its element arguments."""
+        def has_events(el):
+            if isinstance(el, ManyElements):
+                el = el.element_kwargs
+                return bool(el.get('before_print') or el.get('after_print'))
+            return bool(el.before_print or el.after_print)
+
+        return bool(band.before_print or band.after_print or
+                [el for el in band.elements if has_events(el)])
+
+    def prepare_element(self, element, band):
+        """Classifies a band element, once per generator, as static (rendered
+        the same way for every object, see is_static_element) or dependent on
+        the object. Static labels store their measured height here, and static
+        elements their clone (see clone_element)."""
+        key = (id(band), id(element))
+
+        if key not in self._prepared_elements:
+            # Elements created while rendering (i.e. by ManyElements) are not kept
+            if element not in band.elements:
+                return {'static': False, 'height': None}
+
+            self._prepared_elements[key] = {
+                    'key': key,
+                    'element': element, # Kept to make sure its id is not reused
+                    'band': band,
+                    'static': self.is_static_element(element) and not self.band_has_events(band),
+                    'height': None,
+                    'clone': None,
+                    }
+
+        return self._prepared_elements[key]
+
+    def clone_element(self, element, prepared):
+        """Returns a copy of a band element to render for an object. Static
+        elements are cloned just once, and that clone is copied for every object
+        with no initialization again, as each one still has its own position."""
+        if not prepared['static']:
+            return element.clone()
+
+        if prepared['clone'] is None:
+            prepared['clone'] = element.clone()
+
+        clone = prepared['clone']
+        new = clone.__class__.__new__(clone.__class__)
+        new.__dict__.update(clone.__dict__)
+
+        return new
+
+    def is_static_element(self, element):
+        """Returns True if an element is rendered the same way for every object
+        and on every page (i.e. labels with constant text and graphics)"""
+        if element.before_print or element.after_print:
+            return False
+
+        if isinstance(element, Widget):
+            return isinstance(element, Label) and not element.get_value and\
+                    not isinstance(element, (ObjectValue, SystemField))
+
+        if isinstance(element, (BarCode, BaseChart)):
+            return False
+
+        if isinstance(element, Image):
+            return bool(element.filename and not element.get_image)
+
+        return isinstance(element, Graphic)
+
     def render_end_current_page(self):
         """Closes the current page, using page breaker constant. Everything done after
         this will draw into a new page. Before this, using the generate_page_footer
@@ -532,107 +837,917 @@ class ReportGenerator(GeraldoObject):
         # Preparing local auxiliar variables
         self._current_page_number = self.report.first_page_number
         self._current_object_index = 0
-        objects = self.report.get_objects_list()
+
+        # Previews fetch just the objects they render, and objects prefetching
+        # fetches them while rendering
+        if self.preview_pages or self.can_prefetch_objects():
+            objects = self.start_objects_fetching()
+        else:
+            objects = self.report.get_objects_list()
 
         # just an alias to make it shorter
         d_band = self.report.band_detail
 
-        # Empty report
-        if self.report.print_if_empty and not objects:
-            self.start_new_page()
-            self.render_begin()
-            self.render_end_current_page()
+        # Objects fetching and the images thread pool are finished even if the
+        # rendering fails
+        try:
+            # Starts loading images of detail bands in background
+            self.start_images_prefetching(objects)
 
-        # Loop for pages
-        while self._current_object_index < len(objects):
-            # Starts a new page and generates the page header band
-            self.start_new_page()
-            first_object_on_page = True
+            # Resumes the layout from a stored checkpoint if generating a pages range
+            self.start_checkpoints(objects)
+            self.start_incremental(objects)
 
-            # Generate the report begin band
-            if self._is_first_page:
+            # Empty report
+            if self.report.print_if_empty and not objects:
+                self.start_new_page()
                 self.render_begin()
+                self.render_end_current_page()
 
-            # Does generate objects if there is no details band
-            if not d_band:
-                self._current_object_index = len(objects)
-
-            # Loop for objects to go into grid on current page
+            # Loop for pages
             while self._current_object_index < len(objects):
-                # Get current object from list
-                self._current_object = objects[self._current_object_index]
+                self.store_checkpoint()
 
-                # Renders group bands for changed values
-                self.calc_changed_groups(first_object_on_page)
+                # Takes the next pages from the latest layout if it is the same from here
+                if self._previous_layout and self.reuse_previous_pages(objects):
+                    break
 
-                if not first_object_on_page:
-                    # The current_object of the groups' footers is the previous 
-                    # object, so we have access, in groups' footers, to the last
-                    # object before the group breaking
-                    self._current_object = objects[self._current_object_index-1]
-                    self.render_groups_footers()
+                # Starts a new page and generates the page header band
+                self.start_new_page()
+                first_object_on_page = True
+
+                # Generate the report begin band
+                if self._is_first_page:
+                    self.render_begin()
+
+                # Does generate objects if there is no details band
+                if not d_band:
+                    self._current_object_index = len(objects)
+
+                # Loop for objects to go into grid on current page
+                while self._current_object_index < len(objects):
+                    # Get current object from list
                     self._current_object = objects[self._current_object_index]
 
-                self.render_groups_headers(first_object_on_page)
+                    # Renders group bands for changed values
+                    self.calc_changed_groups(first_object_on_page)
+
+                    if not first_object_on_page:
+                        # The current_object of the groups' footers is the previous 
+                        # object, so we have access, in groups' footers, to the last
+                        # object before the group breaking
+                        self._current_object = objects[self._current_object_index-1]
+                        self.render_groups_footers()
+                        self._current_object = objects[self._current_object_index]
+
+                    self.render_groups_headers(first_object_on_page)
+
+                    # Keeps images of the next objects loading
+                    self.prefetch_images_for(objects, self._current_object_index)
+
+                    # Generate this band only if it is visible
+                    # - "done True" means band was rendered ok
+                    # - "done False" means band rendering was aborted
+                    # - "done None" means band didn't render, but wasn't aborted
+                    if d_band.visible:
+                        done = self.render_band(d_band)
+                    else:
+                        done = None
+
+                    # Renders subreports
+                    if done != False:
+                        self.render_subreports()
+
+                    # Next object
+                    self._current_object_index += 1
+                    first_object_on_page = False
+                    self.fetch_objects(objects, self._current_object_index)
+
+                    # Break this if this page doesn't suppport nothing more...
+                    # ... if there is no more available height
+                    if done != False:
+                        if self.get_available_height() < self.calculate_size(d_band.height):
+                            # right margin is not considered to calculate the necessary space
+                            d_width = self.get_band_width(d_band) + self.calculate_size(getattr(d_band, 'margin_left', 0))
+
+                            # ... and this is not an inline displayed detail band or there is no width available
+                            if not getattr(d_band, 'display_inline', False) or self.get_available_width() < d_width:
+                                break
+
+                        # ... or this band forces a new page and this is not the last object in objects list
+                        elif d_band.force_new_page and self._current_object_index < len(objects):
+                            break
+
+                # Sets this is the latest page or not
+                self._is_latest_page = self._current_object_index >= len(objects)
+
+                # Renders the finish group footer bands
+                if self._is_latest_page:
+                    self.calc_changed_groups(False)
+                    self.render_groups_footers(force=True)
+
+                # Ends the current page, printing footer and summary and necessary
+                self.render_end_current_page()
+
+                if self.stream_pages:
+                    self.generate_streamed_pages()
+
+                # Breaks if this is the latest item
+                if self._is_latest_page:
+                    break
+
+                # Breaks if the pages range has been rendered
+                if self.page_range and self.is_page_range_rendered():
+                    break
+
+                # Breaks if the pages of the preview have been rendered
+                if self.preview_pages and len(self._rendered_pages) >= self.preview_pages:
+                    self.stop_preview()
+                    break
+
+                # Increment page number
+                self._current_page_number += 1
+        finally:
+            self.stop_objects_fetching()
+            self.stop_images_prefetching()
+
+        self.stop_incremental()
+        self.stop_checkpoints(objects)
+
+    # Pages planning
+
+    def can_plan_pages(self):
+        """Returns True if the pages of this report depend only on its bands
+        heights, so they can be planned with no rendering (see plan_pages)"""
+        report = self.report
+        d_band = report.band_detail
+
+        if not d_band or report.subreports or report.on_new_page:
+            return False
+
+        if getattr(d_band, 'display_inline', False):
+            return False
+
+        bands = [report.band_begin, report.band_summary, report.band_page_header,
+                report.band_page_footer, d_band]
+        for group in report.groups:
+            bands.extend([group.band_header, group.band_footer])
+
+        for band in bands:
+            if band and (band.auto_expand_height or band.child_bands or
+                    self.band_has_events(band)):
+                return False
+
+        return True
+
+    def plan_pages(self):
+        """Calculates the pages of the report using just band heights, with the
+        same page breaking rules of render_bands, but without rendering any
+        element. Returns a PagePlan or None if the report has elements of
+        variable height, events or subreports (see can_plan_pages)."""
+        if not self.can_plan_pages():
+            return None
+
+        report = self.report
+        calc = self.calculate_size
+        objects = report.get_objects_list()
+        d_band = report.band_detail
+        groups = report.groups
+
+        # Client height, in the same order of operations of get_available_height
+        page_height = calc(report.page_size[1]) - calc(report.margin_bottom) - calc(report.margin_top)
+        page_bands_heights = [calc(b.height) for b in (report.band_page_header,
+            report.band_page_footer) if b]
+        detail_height = calc(d_band.height)
+        heights = {}
+
+        def band_height(band):
+            if band not in heights:
+                height = calc(band.height)
+                height += calc(getattr(band, 'margin_top', 0))
+                height += calc(getattr(band, 'margin_bottom', 0))
+                heights[band] = height
+            return heights[band]
+
+        def available():
+            ret = page_height - state['top']
+            for height in page_bands_heights:
+                ret -= height
+            return ret
+
+        def new_page():
+            pages.append([index[0], 0])
+            state['top'] = 0
+
+        def render(band):
+            state['top'] += band_height(band)
+
+        def force_blank(height):
+            if Decimal(str(available())) < Decimal(str(height)):
+                new_page()
+                return True
+            return False
+
+        def calc_changed(obj, force_no_changed):
+            changed = force_no_changed
+            for group in groups:
+                value = get_attr_value(obj, group.attribute_name)
+                changed = changed or value != values.get(group, None)
+                changes[group] = changed
+                values[group] = value
+                if changed:
+                    stack.append(group)
+
+        def render_footers(force=False):
+            for group in reversed(groups):
+                if force or (changes.get(group, None) and stack and stack[-1] == group):
+                    if group.band_footer and group.band_footer.visible:
+                        force_blank(calc(group.band_footer.height))
+                        render(group.band_footer)
+                    stack.pop()
+
+        def render_headers(first_object_on_page):
+            is_new_page = False
+            for group in groups:
+                if changes.get(group, None):
+                    if group.band_header and group.band_header.visible:
+                        is_new_page = force_blank(calc(group.band_header.height))
+
+                    if not is_new_page and group.force_new_page and index[0] > 0 and\
+                       not first_object_on_page:
+                        new_page()
+
+                    if group.band_header and group.band_header.visible:
+                        render(group.band_header)
+
+        def render_end_page(is_latest_page):
+            if is_latest_page and report.band_summary and report.band_summary.visible:
+                del stack[:]
+                force_blank(calc(report.band_summary.height))
+                render(report.band_summary)
+
+        pages = []
+        index = [0]
+        state = {'top': 0}
+        values, changes, stack = {}, {}, []
+        is_first_page = True
+        begin = report.band_begin if report.band_begin and report.band_begin.visible else None
+
+        # Empty report
+        if report.print_if_empty and not objects:
+            new_page()
+            if begin:
+                render(begin)
+            render_end_page(True)
+
+        while index[0] < len(objects):
+            new_page()
+            first_object_on_page = True
+
+            if is_first_page and begin:
+                render(begin)
+
+            while index[0] < len(objects):
+                calc_changed(objects[index[0]], first_object_on_page)
+
+                if not first_object_on_page:
+                    render_footers()
+
+                render_headers(first_object_on_page)
 
-                # Generate this band only if it is visible
-                # - "done True" means band was rendered ok
-                # - "done False" means band rendering was aborted
-                # - "done None" means band didn't render, but wasn't aborted
                 if d_band.visible:
-                    done = self.render_band(d_band)
+                    render(d_band)
+                    pages[-1][1] += 1
+
+                index[0] += 1
+                first_object_on_page = False
+
+                if available() < detail_height:
+                    break
+                elif d_band.force_new_page and index[0] < len(objects):
+                    break
+
+            is_latest_page = index[0] >= len(objects)
+
+            if is_latest_page:
+                calc_changed(objects[index[0] - 1], False)
+                render_footers(force=True)
+
+            render_end_page(is_latest_page)
+            is_first_page = False
+
+        return PagePlan(pages, len(objects))
+
+    # Streaming
+
+    def generate_streamed_pages(self):
+        """Generates the pages laid out since the latest call and releases their
+        elements (see 'stream_pages'). The pages before the current one don't
+        change anymore."""
+        current_page_number = self._current_page_number
+
+        # Just the pages of the range are generated, numbered by their position
+        # in the report
+        for num, page in self.get_pages_to_generate():
+            self.generate_page(num, page)
+            page._elements = []
+
+        self._streamed_pages_count = len(self._rendered_pages)
+        self._current_page_number = current_page_number
+
+    def generate_page(self, num, page):
+        """Generates a rendered page, with its index"""
+        raise Exception('Not implemented')
+
+    def get_rendered_page_count(self):
+        """Returns the count of pages laid out by this generator, what is the
+        page count unless this report is part of a bigger document"""
+        return len(self._rendered_pages)
+
+    # Pipeline
+
+    def can_pipeline(self):
+        """Returns True if the pages can be laid out by a forked process while
+        this one generates them (see 'pipeline'). The page count, if shown,
+        must be known before (informed or planned). Elements drawn with their
+        objects (charts, barcodes, images from 'get_image' and texts not cached)
+        and events are not supported. Daemonic processes (i.e. workers of a
+        ReportPool) can't start the layout process, and processes running other
+        threads aren't forked, as a lock held by a thread would never be
+        released in the forked process. The threads prefetching objects and
+        images finish with each generation, so they don't count, and other
+        threads turning the pipeline off issue a RuntimeWarning."""
+        report = self.report
+
+        if not PIPELINE_START_METHOD or self.return_pages or self._rendered_pages or\
+           self.page_range or self.preview_pages or self.incremental:
+            return False
+
+        if multiprocessing.current_process().daemon:
+            return False
+
+        if not self.can_resume_layout() or report.find_by_type(BaseChart) or\
+           report.find_by_type(BarCode):
+            return False
+
+        if [el for el in report.find_by_type(Image) if el.get_image] or\
+           [el for el in report.find_by_type(ObjectValue) if not el.stores_text_in_cache]:
+            return False
+
+        # Just lists can be read by the planning and then by the layout
+        if self._page_count is None and report.uses_page_count():
+            plan = isinstance(report.queryset, (list, tuple)) and self.plan_pages()
+            if not plan:
+                return False
+
+            self._page_count = plan.page_count
+
+        if threading.active_count() > 1:
+            warnings.warn('Pages are not laid out by a pipeline, as other threads are running',
+                    RuntimeWarning)
+            return False
+
+        return True
+
+    def get_pipeline_shared_objects(self):
+        """Returns the objects the layout process has the same way this one has,
+        as it is forked: this generator, the report, its children and their
+        attribute values and functions"""
+        shared = [self]
+
+        for obj in [self.report] + self.report.find_by_type(GeraldoObject):
+            shared.append(obj)
+            shared.extend([value for value in vars(obj).values()
+                if not isinstance(value, (str, bytes, int, float, type(None)))])
+
+            for cls in type(obj).__mro__:
+                shared.extend([value for value in vars(cls).values()
+                    if isinstance(value, types.FunctionType)])
+
+        return shared
+
+    def render_bands_by_pipeline(self):
+        """Lays out the pages in a forked process that sends each page as soon
+        as it ends, and generates them here as they come"""
+        shared = self.get_pipeline_shared_objects()
+
+        context = multiprocessing.get_context(PIPELINE_START_METHOD)
+        conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(target=self.run_layout_process, args=(child_conn, shared))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        try:
+            while True:
+                try:
+                    data = conn.recv_bytes()
+                except EOFError:
+                    process.join(1)
+                    raise PipelineError('Layout process died (exit code %s)'%process.exitcode)
+
+                message = PageUnpickler(io.BytesIO(data), shared).load()
+
+                if message[0] == 'page':
+                    self._rendered_pages.append(message[1])
+                    self.generate_streamed_pages()
+                elif message[0] == 'error':
+                    raise message[1]
                 else:
-                    done = None
+                    break
+        finally:
+            conn.close()
 
-                # Renders subreports
-                if done != False:
-                    self.render_subreports()
+            if process.is_alive():
+                process.terminate()
+            process.join()
 
-                # Next object
-                self._current_object_index += 1
-                first_object_on_page = False
+    def run_layout_process(self, conn, shared):
+        """Main function of the layout process of a pipeline. It sends the
+        pages instead of generating them, and the exception if it fails."""
+        def send(message):
+            data = io.BytesIO()
+            PagePickler(data, shared).dump(message)
+            conn.send_bytes(data.getvalue())
 
-                # Break this if this page doesn't suppport nothing more...
-                # ... if there is no more available height
-                if done != False:
-                    if self.get_available_height() < self.calculate_size(d_band.height):
-                        # right margin is not considered to calculate the necessary space
-                        d_width = self.calculate_size(d_band.width) + self.calculate_size(getattr(d_band, 'margin_left', 0))
+        def send_page(num, page):
+            self.detach_page(page)
+            send(('page', page))
 
-                        # ... and this is not an inline displayed detail band or there is no width available
-                        if not getattr(d_band, 'display_inline', False) or self.get_available_width() < d_width:
-                            break
+        self.stream_pages = True
+        self.generate_page = send_page
+
+        try:
+            self.render_bands()
+            self.generate_streamed_pages() # Pages not laid out by the main loop
+            send(('end',))
+        except Exception as e:
+            try:
+                send(('error', e))
+            except Exception:
+                send(('error', PipelineError(repr(e))))
+        finally:
+            conn.close()
+
+    def detach_page(self, page):
+        """Keeps the texts of the page elements and releases their objects, that
+        the process generating the page doesn't have"""
+        for element in page._elements:
+            if isinstance(element, ObjectValue):
+                element.text # Caches the text
+                element.objects = None
+            elif isinstance(element, Label) and not isinstance(element, SystemField) and\
+                 element.get_value:
+                element.text, element.get_value = element.text, None
+
+            element.instance = None
+
+    # Pages range
+
+    def get_pages_to_generate(self):
+        """Returns the rendered pages to generate, with their indices, just the
+        ones in page_range if it is informed and not streamed yet"""
+        pages = [(num, page) for num, page in enumerate(self._rendered_pages)
+                if page.elements and num >= self._streamed_pages_count]
+
+        if self.page_range:
+            first, last = self.page_range
+            pages = [(num, page) for num, page in pages if first - 1 <= num < last]
+
+        return pages
+
+    def get_layout_key(self):
+        """Returns a string with the report attributes the layout of pages
+        depends on: page size, margins, and heights and visibility of bands and
+        their elements. They can be changed on each report instance."""
+        report = self.report
+        bands = [(band.height, band.visible, band.force_new_page, band.auto_expand_height,
+            getattr(band, 'display_inline', False), getattr(band, 'margin_top', 0),
+            getattr(band, 'margin_bottom', 0), [(getattr(el, 'top', None),
+                getattr(el, 'height', None), getattr(el, 'visible', True))
+                for el in band.elements])
+            for band in report.find_by_type(ReportBand)]
+
+        return repr((report.page_size, report.margin_top, report.margin_bottom,
+            report.margin_left, report.margin_right, bands))
+
+    def get_checkpoints_key(self, objects):
+        return (self.__class__, self.get_layout_key(), self.get_hash_key(objects))
+
+    def can_resume_layout(self):
+        """Returns True if the layout can start from a checkpoint, what is not
+        possible when events could change anything while rendering"""
+        if self.report.on_new_page:
+            return False
+
+        return not [band for band in self.report.find_by_type(ReportBand)
+                if self.band_has_events(band)]
+
+    def start_checkpoints(self, objects):
+        """Loads the checkpoints stored for this report data and, if possible,
+        restores the latest one before the pages range"""
+        # Pages informed to compose with other reports are not supported
+        if not self.page_range or self._rendered_pages or self.preview_pages:
+            return
+
+        self._checkpoints = {}
+        stored = page_checkpoints.get(self.get_checkpoints_key(objects))
+        if stored:
+            self._checkpoints.update(stored['checkpoints'])
+            self._page_count = stored['page_count']
+
+        # The page count of a planned report is known before rendering
+        if self._page_count is None:
+            plan = self.plan_pages()
+            self._page_count = plan and plan.page_count
+
+        if not self.can_resume_layout():
+            return
+
+        previous = [index for index in self._checkpoints if index < self.page_range[0]]
+        if previous:
+            self.restore_checkpoint(self._checkpoints[max(previous)], objects)
+
+    def store_checkpoint(self):
+        """Stores the generator state before starting a new page in the main
+        loop of render_bands"""
+        if self._checkpoints is None:
+            return
+
+        # Groups are stored by position, to be restored on other report instances
+        groups = list(self.report.groups)
+        def by_position(values):
+            return dict([(num, values[group]) for num, group in enumerate(groups) if group in values])
+
+        page_index = len(self._rendered_pages)
+        self._checkpoints[page_index] = {
+                'page_index': page_index,
+                'object_index': self._current_object_index,
+                'page_number': self._current_page_number,
+                'is_first_page': self._is_first_page,
+                'top_position': self._current_top_position,
+                'groups_values': by_position(self._groups_values),
+                'groups_working_values': by_position(self._groups_working_values),
+                'groups_working_is_values': self._groups_working_values is self._groups_values,
+                'groups_changed': by_position(self._groups_changed),
+                'groups_stack': [groups.index(group) for group in self._groups_stack],
+                }
+
+    def restore_checkpoint(self, checkpoint, objects, pages=None):
+        """Sets the generator state from a checkpoint. Pages before it are the
+        informed ones or are kept empty, just to keep the page numbers"""
+        if pages is None:
+            pages = [ReportPage() for num in range(checkpoint['page_index'])]
+        self._rendered_pages.extend(pages)
+
+        self._current_object_index = checkpoint['object_index']
+        if self._current_object_index:
+            self._current_object = objects[self._current_object_index - 1]
+        self._current_page_number = checkpoint['page_number']
+        self._is_first_page = checkpoint['is_first_page']
+        self._current_top_position = checkpoint['top_position']
+        groups = list(self.report.groups)
+        def by_group(values):
+            return dict([(groups[num], value) for num, value in values.items()])
+
+        self._groups_values = by_group(checkpoint['groups_values'])
+        if checkpoint['groups_working_is_values']:
+            self._groups_working_values = self._groups_values
+        else:
+            self._groups_working_values = by_group(checkpoint['groups_working_values'])
+        self._groups_changed = by_group(checkpoint['groups_changed'])
+        self._groups_stack = [groups[num] for num in checkpoint['groups_stack']]
+
+    def is_page_range_rendered(self):
+        """Releases the elements of pages out of the range and returns True if
+        the pages range has been rendered and the page count is known"""
+        first, last = self.page_range
+
+        for page in self._rendered_pages[:first - 1] + self._rendered_pages[last:]:
+            page._elements = []
+
+        return len(self._rendered_pages) >= last and self._page_count is not None
+
+    def stop_checkpoints(self, objects):
+        """Stores the checkpoints of this layout with the previous ones"""
+        if self._checkpoints is None or not self.page_range:
+            return
+
+        if self._is_latest_page:
+            self._page_count = len(self._rendered_pages)
+
+        page_checkpoints.set(self.get_checkpoints_key(objects), {
+            'checkpoints': self._checkpoints,
+            'page_count': self._page_count,
+            })
+        self._checkpoints = None
+
+    # Incremental rendering
+
+    def get_incremental_key(self):
+        return (self.__class__, self.report.cache_prefix)
+
+    def can_render_incrementally(self):
+        """Returns True if each page depends only on its objects, so pages of
+        unchanged objects can be reused. Aggregations, charts and subreports
+        use other objects, and objects are compared just by the attributes of
+        ObjectValue widgets and groups, so values got by lambdas (get_value,
+        get_text and get_image), barcodes and texts not cached aren't
+        compared."""
+        report = self.report
+
+        if report.subreports or not self.can_resume_layout():
+            return False
+
+        if report.find_by_type(BaseChart) or report.find_by_type(BarCode):
+            return False
+
+        if [el for el in report.find_by_type(Image) if el.get_image] or\
+           [el for el in report.find_by_type(Label) if el.get_value]:
+            return False
+
+        return not [widget for widget in report.find_by_type(ObjectValue)
+                if widget.expression or widget.action not in ('value', 'coalesce') or
+                widget.get_text or not widget.stores_text_in_cache]
+
+    def start_incremental(self, objects):
+        """Compares the objects with the ones of the latest layout of this
+        report and restores its checkpoint before the first changed object,
+        reusing the previous pages"""
+        if not self.incremental or self.page_range or self.preview_pages or self._rendered_pages:
+            return
+
+        reprs = make_objects_reprs(self.report, objects)
+        previous = incremental_layouts.get(self.get_incremental_key())
+        self._checkpoints = {}
+        self._previous_layout = {'reprs': reprs}
+
+        if not previous or not self.can_render_incrementally():
+            return
 
-                    # ... or this band forces a new page and this is not the last object in objects list
-                    elif d_band.force_new_page and self._current_object_index < len(objects):
-                        break
+        # First changed object and count of equal objects at the end
+        prev_reprs = previous['reprs']
+        first_changed = 0
+        while first_changed < min(len(reprs), len(prev_reprs)) and\
+              reprs[first_changed] == prev_reprs[first_changed]:
+            first_changed += 1
+
+        equal_tail = 0
+        while equal_tail < min(len(reprs), len(prev_reprs)) and\
+              reprs[-1 - equal_tail] == prev_reprs[-1 - equal_tail]:
+            equal_tail += 1
+
+        self._previous_layout.update(previous=previous, equal_tail=equal_tail)
+
+        # The page before the checkpoint must not be the latest one now
+        checkpoints = [cp for cp in previous['checkpoints'].values()
+                if cp['object_index'] <= first_changed and cp['object_index'] < len(objects)]
+        if checkpoints:
+            checkpoint = max(checkpoints, key=lambda cp: cp['page_index'])
+
+            for index, cp in previous['checkpoints'].items():
+                if index < checkpoint['page_index']:
+                    self._checkpoints[index] = cp
+
+            self.restore_checkpoint(checkpoint, objects,
+                    previous['pages'][:checkpoint['page_index']])
+
+    def reuse_previous_pages(self, objects):
+        """Appends the next pages of the latest layout if this page starts in
+        the same state of one of them, with the same objects until the end.
+        Returns True if so."""
+        previous = self._previous_layout.get('previous')
+        if not previous:
+            return False
+
+        index = self._current_object_index
+        if len(objects) - index > self._previous_layout['equal_tail']:
+            return False
+
+        prev_index = index + len(previous['reprs']) - len(objects)
+        current = self._checkpoints[len(self._rendered_pages)]
+        state_keys = ('is_first_page', 'top_position', 'groups_values', 'groups_working_values',
+                'groups_working_is_values', 'groups_changed', 'groups_stack')
+
+        for cp in previous['checkpoints'].values():
+            if cp['object_index'] != prev_index or\
+               [cp[k] for k in state_keys] != [current[k] for k in state_keys]:
+                continue
+
+            # Checkpoints of the reused pages are shifted to their new numbers
+            page_shift = current['page_index'] - cp['page_index']
+            number_shift = current['page_number'] - cp['page_number']
+            for prev_cp in previous['checkpoints'].values():
+                if prev_cp['page_index'] >= cp['page_index']:
+                    new_cp = dict(prev_cp)
+                    new_cp['page_index'] += page_shift
+                    new_cp['object_index'] += index - prev_index
+                    new_cp['page_number'] += number_shift
+                    self._checkpoints[new_cp['page_index']] = new_cp
+
+            pages = previous['pages'][cp['page_index']:]
+            for page in pages:
+                for element in page.get_children():
+                    element.generator = self
+            self._rendered_pages.extend(pages)
+
+            self._current_object_index = len(objects)
+            self._is_latest_page = True
+            return True
+
+        return False
+
+    def stop_incremental(self):
+        """Stores this layout to be compared with the next one"""
+        if self._previous_layout is None:
+            return
+
+        incremental_layouts.set(self.get_incremental_key(), {
+            'reprs': self._previous_layout['reprs'],
+            'checkpoints': self._checkpoints,
+            'pages': list(self._rendered_pages),
+            })
+        self._previous_layout = None
+        self._checkpoints = None
+
+    # Objects fetching
+
+    def can_prefetch_objects(self):
+        """Returns True if objects can be fetched while rendering. Pages ranges
+        and incremental rendering compare all the objects before rendering."""
+        return bool(self.prefetch_objects and self.report.band_detail and
+                not self.page_range and not self.incremental)
+
+    def start_objects_fetching(self):
+        """Returns the objects list to render a preview or with objects
+        prefetching. It starts with the first object and is extended by
+        fetch_objects while rendering. Reports overriding 'get_objects_list'
+        are fetched from the list it returns."""
+        if type(self.report).get_objects_list is not BaseReport.get_objects_list:
+            queryset = self.report.get_objects_list()
+        else:
+            queryset = self.report.queryset
+
+        if queryset is None:
+            queryset = []
+
+        if self.prefetch_objects:
+            self._objects_iterator = PrefetchingReader(queryset, self.prefetch_objects,
+                    self.prefetch_batches)
+        else:
+            self._objects_iterator = iter(queryset)
+
+        objects = []
+        try:
+            self.fetch_objects(objects, 0)
+        except Exception:
+            self.stop_objects_fetching()
+            raise
+
+        return objects
+
+    def fetch_objects(self, objects, index):
+        """Pulls objects from the queryset until the one at 'index' (and the
+        next ones in the images prefetching window) is available"""
+        if self._objects_iterator is None:
+            return
+
+        count = index + 1 + self.prefetch_images - len(objects)
+        if count > 0:
+            objects.extend(itertools.islice(self._objects_iterator, count))
+
+    def stop_objects_fetching(self):
+        if self._objects_iterator is None:
+            return
+
+        if isinstance(self._objects_iterator, PrefetchingReader):
+            self._objects_iterator.close()
+
+        self._objects_iterator = None
+
+    # Preview
+
+    def stop_preview(self):
+        """Sets the page count of a preview stopped before the latest page. It
+        is estimated from the objects per page if the queryset is a list or a
+        tuple, otherwise it is the rendered pages count as a minimum."""
+        queryset = self.report.queryset
+        pages_count = len(self._rendered_pages)
+
+        if isinstance(queryset, (list, tuple)) and self._current_object_index:
+            objects_per_page = float(self._current_object_index) / pages_count
+            estimate = int(math.ceil(len(queryset) / objects_per_page))
+            self._page_count = PreviewPageCount(max(estimate, pages_count + 1))
+        else:
+            self._page_count = PreviewPageCount(pages_count)
+            self._page_count.minimum = True
 
-            # Sets this is the latest page or not
-            self._is_latest_page = self._current_object_index >= len(objects)
+        self.stop_objects_fetching()
 
-            # Renders the finish group footer bands
-            if self._is_latest_page:
-                self.calc_changed_groups(False)
-                self.render_groups_footers(force=True)
+    # Images prefetching
 
-            # Ends the current page, printing footer and summary and necessary
-            self.render_end_current_page()
+    def start_images_prefetching(self, objects):
+        """Starts the thread pool that loads images from 'get_image' lambdas of
+        detail bands for the next objects, while the current ones are rendered.
+        Does nothing if 'prefetch_images' is zero."""
+        d_band = self.report.band_detail
+
+        if not self.prefetch_images or not d_band or not ThreadPoolExecutor:
+            return
+
+        self._prefetch_elements = []
+        for band in [d_band] + list(d_band.child_bands or []):
+            self._prefetch_elements.extend([(el, band) for el in band.elements
+                if isinstance(el, Image) and el.get_image])
+
+        if not self._prefetch_elements:
+            return
+
+        self._prefetched_images = {}
+        self._prefetch_next_index = 0
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=self.prefetch_workers)
+
+    def prefetch_images_for(self, objects, index):
+        """Submits the images of the objects in the prefetch window starting at
+        'index' and discards the ones left behind"""
+        if not self._prefetch_executor:
+            return
+
+        for key, (obj, future) in list(self._prefetched_images.items()):
+            if key[1] < index:
+                future.cancel()
+                del self._prefetched_images[key]
+
+        self._prefetch_next_index = max(self._prefetch_next_index, index)
+        last_index = min(index + self.prefetch_images, len(objects))
+
+        while self._prefetch_next_index < last_index:
+            obj = objects[self._prefetch_next_index]
+
+            for element, band in self._prefetch_elements:
+                future = self._prefetch_executor.submit(self.prefetch_image, element, band, obj)
+                self._prefetched_images[(id(element), self._prefetch_next_index)] = (obj, future)
+
+            self._prefetch_next_index += 1
+
+    def prefetch_image(self, element, band, obj):
+        """Runs in the thread pool. Returns a clone of the image element with its
+        image already loaded (and downsampled) for the object"""
+        graphic = element.clone()
+        graphic.instance = obj
+        graphic.generator = self
+        graphic.report = self.report
+        graphic.band = band
+        graphic.get_scaled_image()
+
+        return graphic
 
-            # Breaks if this is the latest item
-            if self._is_latest_page:
-                break
+    def get_prefetched_image(self, element, current_object):
+        """Returns the prefetched clone of an image element for the object, waiting
+        for it if still loading, or None if it wasn't prefetched. Images are kept
+        by the index of their objects, as ids of objects fetched and discarded
+        can be reused."""
+        if not self._prefetched_images:
+            return None
 
-            # Increment page number
-            self._current_page_number += 1
+        key = (id(element), self._current_object_index)
+        item = self._prefetched_images.get(key)
+        if not item or item[0] is not current_object:
+            return None
+
+        del self._prefetched_images[key]
+
+        return item[1].result()
+
+    def stop_images_prefetching(self):
+        if not self._prefetch_executor:
+            return
+
+        for obj, future in self._prefetched_images.values():
+            future.cancel()
+
+        self._prefetch_executor.shutdown(wait=True)
+        self._prefetch_executor = None
+        self._prefetched_images = None
 
     def calculate_size(self, size):
         """Uses the function 'calculate_size' to calculate a size"""
+        # Just strings have to be evaluated
+        if not isinstance(size, str):
+            return size
+
         return calculate_size(size)
 
     def get_left_pos(self):
         """Returns the left position of the drawer. Is useful on inline displayed detail bands"""
         return self.calculate_size(self.report.margin_left) + self._current_left_position
 
+    def get_band_width(self, band):
+        """Returns the band width, that is the page width between margins when
+        the band has no width"""
+        return self.calculate_size(band.width) or (self.calculate_size(self.report.page_size[0]) -
+                self.calculate_size(self.report.margin_left) - self.calculate_size(self.report.margin_right))
+
     def get_available_width(self):
         return self.calculate_size(self.report.page_size[0]) - self.calculate_size(self.report.margin_left) -\
                 self.calculate_size(self.report.margin_right) - self._current_left_position
@@ -689,6 +1804,9 @@ class ReportGenerator(GeraldoObject):
     def get_page_count(self):
         """Calculate and returns the page count for this report. The challenge
         here is do this calculate before to generate the pages."""
+        if self._page_count is not None:
+            return self._page_count
+
         return len(self._rendered_pages)
 
     def make_paragraph(self, text, style=None):
@@ -703,6 +1821,26 @@ class ReportGenerator(GeraldoObject):
         """Wraps the barcode on the height/width informed"""
         raise Exception('Not implemented')
 
+    def get_wrapped_paragraph(self, text, band, style, width, height):
+        """Returns a paragraph wrapped on the height/width informed. Paragraphs
+        with the same text, band, style and dimensions (i.e. repeated values
+        like status or country) are made once and kept in 'wrap_cache', to be
+        used to measure and to draw them."""
+        try:
+            key = (text, id(band), repr(sorted((style or {}).items())), width, height)
+            para = self.wrap_cache.get(key)
+        except TypeError: # Unhashable values
+            key = para = None
+
+        if para is None:
+            para = self.make_paragraph(text, self.make_paragraph_style(band, style))
+            self.wrap_paragraph_on(para, width, height)
+
+            if key:
+                self.wrap_cache.set(key, para)
+
+        return para
+
     # Stylizing
 
     def set_fill_color(self, color):
@@ -801,6 +1939,27 @@ class ReportGenerator(GeraldoObject):
         # Defaul detail driver queryset
         return self.report.queryset
 
+    def get_queryset_aggregate(self, action, attribute_name):
+        """Returns a tuple with the aggregation of an attribute on the current
+        objects computed by the report queryset itself (i.e. by SQL GROUP BY
+        queries of a SQLDataSource), filtered by the current groups, or an empty
+        tuple if it can't compute it. Subreports objects are not computed so."""
+        queryset = self.report.queryset
+        if self._current_queryset is not None or not attribute_name or\
+           not hasattr(queryset, 'get_aggregate'):
+            return ()
+
+        groups = []
+        if self._groups_stack:
+            groups = [group for group in self.report.groups if group in self._groups_working_values]
+
+        names = [group.attribute_name for group in groups]
+        if not queryset.can_aggregate(action, attribute_name, names):
+            return ()
+
+        values = [self._groups_working_values[group] for group in groups]
+        return (queryset.get_aggregate(action, attribute_name, names, values),)
+
     def get_objects_in_group(self):
         """Returns objects filtered in the current group or all if there is no
         group"""
@@ -1,4 +1,4 @@
-import datetime, os
+import datetime, os, itertools, copy
 from .base import ReportGenerator
 
 from reportlab.pdfgen.canvas import Canvas
@@ -8,6 +8,7 @@ from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.fonts import addMapping
+from reportlab.lib.utils import ImageReader
 import collections
 
 try:
@@ -21,7 +22,18 @@ except ImportError:
 
 DEFAULT_TEMP_DIR = '/tmp/'
 
-from geraldo.utils import get_attr_value, calculate_size
+# Limit of image readers kept by a generator, so per-row images don't keep all
+# their data until the end of the document
+IMAGE_READERS_MAX_ITEMS = 100
+
+# Limit of chart drawings kept by a generator to be drawn as forms
+CHART_FORMS_MAX_ITEMS = 100
+
+# Font files registered by this process, as (font name, file path), so they
+# are loaded just once
+registered_fonts = set()
+
+from geraldo.utils import get_attr_value, calculate_size, LRUCache
 from geraldo.widgets import Widget, Label, SystemField
 from geraldo.graphics import Graphic, RoundRect, Rect, Line, Circle, Arc,\
         Ellipse, Image
@@ -38,6 +50,8 @@ class PDFGenerator(ReportGenerator):
     canvas = None
     return_canvas = False
 
+    outline_title = None # Title of an outline entry to the first page
+
     multiple_canvas = False #bool(pyPdf)
     temp_files = None
     temp_file_name = None
@@ -45,17 +59,30 @@ class PDFGenerator(ReportGenerator):
     temp_files_max_pages = 10
     temp_directory = DEFAULT_TEMP_DIR
 
+    _image_readers = None
+    _chart_forms = None
+    _chart_forms_count = 0
+    _static_forms = None
+    _static_paragraphs = None
+    _forms_prefix = 0
+    _generated_pages_count = 0
+
     mimetype = 'application/pdf'
 
     def __init__(self, report, filename=None, canvas=None, return_canvas=False,
             multiple_canvas=None, temp_directory=None, cache_enabled=None,
-            **kwargs):
+            outline_title=None, **kwargs):
         super(PDFGenerator, self).__init__(report, **kwargs)
 
         self.filename = filename
         self.canvas = canvas
         self.return_canvas = return_canvas
+        self.outline_title = outline_title
         self.temp_directory = temp_directory or self.temp_directory
+        self._image_readers = LRUCache(IMAGE_READERS_MAX_ITEMS)
+        self._chart_forms = LRUCache(CHART_FORMS_MAX_ITEMS)
+        self._static_forms = {}
+        self._static_paragraphs = {}
 
         # Cache enabled
         if cache_enabled is not None:
@@ -97,8 +124,20 @@ class PDFGenerator(ReportGenerator):
         # Calls the before_print event
         self.report.do_before_print(generator=self)
 
+        # Pages laid out by a forked process are generated as they come
+        pipelined = self.pipeline and self.can_pipeline()
+        if pipelined:
+            self.stream_pages = True
+
+        # Pages are generated while they are laid out when streaming
+        if self.stream_pages:
+            self.start_pdf()
+
         # Render pages
-        self.render_bands()
+        if pipelined:
+            self.render_bands_by_pipeline()
+        else:
+            self.render_bands()
 
         # Returns rendered pages
         if self.return_pages:
@@ -112,7 +151,8 @@ class PDFGenerator(ReportGenerator):
         self.report.do_before_generate(generator=self)
 
         # Initializes the definitive PDF canvas
-        self.start_pdf()
+        if not self.stream_pages:
+            self.start_pdf()
 
         # Generate the report pages (here it happens)
         self.generate_pages()
@@ -219,6 +259,17 @@ class PDFGenerator(ReportGenerator):
         self.canvas.setSubject(self.report.subject)
         self.canvas.setKeywords(self.report.keywords)
 
+        # Generators drawing on the same canvas give different names to their forms
+        self._forms_prefix = getattr(self.canvas, '_geraldo_generators_count', 0)
+        self.canvas._geraldo_generators_count = self._forms_prefix + 1
+
+        # Outline entry to the first page of this report (i.e. on batches of
+        # reports drawn on the same canvas)
+        if self.outline_title:
+            key = 'page%d'%self.canvas.getPageNumber()
+            self.canvas.bookmarkPage(key)
+            self.canvas.addOutlineEntry(self.outline_title, key, level=0)
+
     def render_page_header(self):
         """Generate the report page header band if it exists"""
         if not self.report.band_page_header:
@@ -325,47 +376,89 @@ class PDFGenerator(ReportGenerator):
 
     def generate_pages(self):
         """Specific method that generates the pages"""
-        self._generation_datetime = datetime.datetime.now()
-
-        for num, page in enumerate([page for page in self._rendered_pages if page.elements]):
-            self._current_page_number = num + 1
-
-            # Multiple canvas support (closes current and creates a new
-            # once if reaches the max pages for temp file)
-            if num and self.multiple_canvas and num % self.temp_files_max_pages == 0:
-                self.close_current_canvas()
-                del self.canvas
-                self.start_canvas()
-
-            # Loop at band widgets
-            for element in page.elements:
-                # Widget element
-                if isinstance(element, Widget):
-                    widget = element
-    
-                    # Set element colors
-                    self.set_fill_color(widget.font_color)
-    
-                    self.generate_widget(widget, self.canvas, num)
-    
-                # Graphic element
-                elif isinstance(element, Graphic):
-                    graphic = element
-    
-                    # Set element colors
-                    self.set_fill_color(graphic.fill_color)
-                    self.set_stroke_color(graphic.stroke_color)
-                    self.set_stroke_width(graphic.stroke_width)
-    
-                    self.generate_graphic(graphic, self.canvas)
-
-            self.canvas.showPage()
+        for num, page in self.get_pages_to_generate():
+            self.generate_page(num, page)
 
         # Multiple canvas support (closes the current one)
         if self.multiple_canvas:
             self.close_current_canvas()
             del self.canvas
 
+    def generate_page(self, num, page):
+        """Draws a rendered page on the canvas"""
+        if self._generation_datetime is None:
+            self._generation_datetime = datetime.datetime.now()
+
+        self._current_page_number = num + 1
+
+        # Multiple canvas support (closes current and creates a new
+        # once if reaches the max pages for temp file)
+        count = self._generated_pages_count
+        if count and self.multiple_canvas and count % self.temp_files_max_pages == 0:
+            self.close_current_canvas()
+            del self.canvas
+            self.start_canvas()
+
+        # Loop at band widgets, drawing page-invariant ones by reference
+        runs = {}
+        for static_key, elements in itertools.groupby(page.elements, lambda el: el.static_key):
+            if static_key and self.report.reuse_static_bands:
+                runs[static_key] = runs.get(static_key, -1) + 1
+                self.generate_static_elements((static_key, runs[static_key]), list(elements), num)
+            else:
+                self.generate_elements(elements, num)
+
+        self.canvas.showPage()
+        self._generated_pages_count += 1
+
+    def generate_elements(self, elements, page_number=0):
+        """Renders a sequence of page elements on the current canvas"""
+        for element in elements:
+            # Widget element
+            if isinstance(element, Widget):
+                widget = element
+
+                # Set element colors
+                self.set_fill_color(widget.font_color)
+
+                self.generate_widget(widget, self.canvas, page_number)
+
+            # Graphic element
+            elif isinstance(element, Graphic):
+                graphic = element
+
+                # Set element colors
+                self.set_fill_color(graphic.fill_color)
+                self.set_stroke_color(graphic.stroke_color)
+                self.set_stroke_width(graphic.stroke_width)
+
+                self.generate_graphic(graphic, self.canvas)
+
+    def generate_static_elements(self, key, elements, page_number=0):
+        """Renders page-invariant elements (see ReportGenerator.is_static_element)
+        into a form XObject on their first occurrence and just references it on
+        the next pages. Elements different from the ones in the form are drawn
+        as usual."""
+        signature = [(el.__class__, el.repr_for_cache_hash_key()) for el in elements]
+
+        if key not in self._static_forms or self._static_forms[key][1] is not self.canvas:
+            # Other reports can be drawn on the same canvas
+            name = 'static%d_%s_%d'%((self._forms_prefix,) + key)
+
+            # State is restored to keep the canvas in sync with the page
+            self.canvas.saveState()
+            self.canvas.beginForm(name)
+            self.generate_elements(elements, page_number)
+            self.canvas.endForm()
+            self.canvas.restoreState()
+
+            self._static_forms[key] = (signature, self.canvas, name)
+
+        if self._static_forms[key][0] == signature:
+            self.canvas.doForm(self._static_forms[key][2])
+        else:
+            self.generate_elements(elements, page_number)
+
     def generate_widget(self, widget, canvas=None, page_number=0):
         """Renders a widget element on canvas"""
         if isinstance(widget, SystemField):
@@ -388,8 +481,19 @@ class PDFGenerator(ReportGenerator):
 
         # This includes also the SystemField above
         if isinstance(widget, Label):
-            para = Paragraph(widget.text, self.make_paragraph_style(widget.band, widget.style))
-            para.wrapOn(canvas, widget.width, widget.height)
+            if widget.truncate_overflow:
+                para = Paragraph(widget.text, self.make_paragraph_style(widget.band, widget.style))
+                para.wrapOn(canvas, widget.width, widget.height)
+            elif widget.static_source:
+                para = self.get_static_paragraph(widget, canvas)
+            else:
+                para = self.get_wrapped_paragraph(widget.text, widget.band, widget.style,
+                        widget.width, widget.height)
+
+                # Paragraphs of prepared reports are shared by concurrent generators
+                # and drawing sets the canvas on them
+                if getattr(self.report, 'prepared', None):
+                    para = copy.copy(para)
 
             if widget.truncate_overflow:
                 keep = self.keep_in_frame(
@@ -408,6 +512,17 @@ class PDFGenerator(ReportGenerator):
             # Calls the after_print event
             widget.do_after_print(generator=self)
 
+    def get_static_paragraph(self, widget, canvas):
+        """Returns the wrapped paragraph of a static label (see
+        ReportGenerator.prepare_element), made once and drawn for every object"""
+        if widget.static_source not in self._static_paragraphs:
+            para = Paragraph(widget.text, self.make_paragraph_style(widget.band, widget.style))
+            para.wrapOn(canvas, widget.width, widget.height)
+
+            self._static_paragraphs[widget.static_source] = para
+
+        return self._static_paragraphs[widget.static_source]
+
     def generate_graphic(self, graphic, canvas=None):
         """Renders a graphic element"""
         canvas = canvas or self.canvas
@@ -475,14 +590,25 @@ class PDFGenerator(ReportGenerator):
                     graphic.fill,
                     )
         elif isinstance(graphic, Image) and graphic.image:
-            canvas.drawInlineImage(
-                    graphic.image,
-                    graphic.left,
-                    graphic.top,
-                    graphic.width,
-                    graphic.height,
-                    preserveAspectRatio=not graphic.stretch,
-                    )
+            # Reused images are registered once in the document as an XObject
+            if self.report.reuse_images:
+                canvas.drawImage(
+                        self.get_image_reader(graphic),
+                        graphic.left,
+                        graphic.top,
+                        graphic.width,
+                        graphic.height,
+                        preserveAspectRatio=not graphic.stretch,
+                        )
+            else:
+                canvas.drawInlineImage(
+                        self.get_image_to_draw(graphic),
+                        graphic.left,
+                        graphic.top,
+                        graphic.width,
+                        graphic.height,
+                        preserveAspectRatio=not graphic.stretch,
+                        )
         elif isinstance(graphic, BarCode):
             barcode = graphic.render()
 
@@ -492,13 +618,81 @@ class PDFGenerator(ReportGenerator):
             drawing = graphic.render()
 
             if drawing:
-                drawing.drawOn(canvas, graphic.left, graphic.top)
+                form_name = self.report.reuse_charts and self.get_chart_form(drawing, canvas)
+
+                if form_name:
+                    canvas.saveState()
+                    canvas.translate(graphic.left, graphic.top)
+                    canvas.doForm(form_name)
+                    canvas.restoreState()
+                else:
+                    drawing.drawOn(canvas, graphic.left, graphic.top)
         else:
             return
  
         # Calls the after_print event
         graphic.do_after_print(generator=self)
 
+    def get_image_to_draw(self, graphic):
+        """Returns the file path of a graphic image if it is drawn as it is,
+        what keeps JPEG files compressed as they are, or the image object
+        downsampled to the graphic resolution"""
+        image = graphic.get_scaled_image()
+
+        if graphic.source and image is graphic.image:
+            return graphic.source
+
+        return image
+
+    def get_image_reader(self, graphic):
+        """Returns the ImageReader for the image of a graphic. Images loaded
+        from the same file path (or the same image object) share the same reader,
+        so their data is read once and ReportLab finds the XObject registered
+        before instead of embedding it again. Up to IMAGE_READERS_MAX_ITEMS
+        readers are kept, the least recently used are released."""
+        image = self.get_image_to_draw(graphic)
+        key = isinstance(image, str) and image or id(image)
+
+        cached = self._image_readers.get(key)
+        if cached is None:
+            # The image is kept together to make sure its id is not reused
+            cached = (image, ImageReader(image))
+            self._image_readers.set(key, cached)
+
+        return cached[1]
+
+    def get_chart_form(self, drawing, canvas):
+        """Returns the name of the form XObject a chart drawing is drawn into,
+        or None on its first occurrence. Charts rendering the same drawing (see
+        geraldo.charts.get_drawings_cache) are drawn once per document and just
+        referenced on the next occurrences. Up to CHART_FORMS_MAX_ITEMS drawings
+        are kept, the least recently used are released."""
+        key = id(drawing)
+        cached = self._chart_forms.get(key)
+
+        # The drawing is kept together to make sure its id is not reused
+        if cached is None or cached[1] is not canvas:
+            self._chart_forms.set(key, (drawing, canvas, None))
+            return None
+
+        if not cached[2]:
+            name = 'chart%d_%d'%(self._forms_prefix, self._chart_forms_count)
+            self._chart_forms_count += 1
+
+            # Labels and legends can be drawn out of the drawing bounds
+            x1, y1, x2, y2 = drawing.getBounds()
+            margin = max(drawing.width, drawing.height)
+
+            canvas.beginForm(name, lowerx=min(x1, 0) - margin, lowery=min(y1, 0) - margin,
+                    upperx=max(x2, drawing.width) + margin, uppery=max(y2, drawing.height) + margin)
+            drawing.drawOn(canvas, 0, 0)
+            canvas.endForm()
+
+            cached = (drawing, canvas, name)
+            self._chart_forms.set(key, cached)
+
+        return cached[2]
+
     def prepare_additional_fonts(self):
         """This method loads additional fonts and register them using ReportLab
         PDF metrics package.
@@ -508,6 +702,11 @@ class PDFGenerator(ReportGenerator):
         if not self.report.additional_fonts:
             return
 
+        def register_font(font_name, font_file):
+            if (font_name, font_file) not in registered_fonts:
+                pdfmetrics.registerFont(TTFont(font_name, font_file))
+                registered_fonts.add((font_name, font_file))
+
         for font_family_name, fonts_or_file in self.report.additional_fonts.items():
             # Supports font family with many styles (i.e: normal, italic, bold, bold-italic, etc.)
             if isinstance(fonts_or_file, (list, tuple, dict)):
@@ -515,16 +714,16 @@ class PDFGenerator(ReportGenerator):
                     # List of tuples with format like ('font-name', 'font-file', True/False bold, True/False italic)
                     if isinstance(font_item, (list, tuple)):
                         font_name, font_file, is_bold, is_italic = font_item
-                        pdfmetrics.registerFont(TTFont(font_name, font_file))
+                        register_font(font_name, font_file)
                         addMapping(font_family_name, is_bold, is_italic, font_name)
 
                     # List of dicts with format like {'file': '', 'name': '', 'bold': False, 'italic': False}
                     elif isinstance(font_item, dict):
-                        pdfmetrics.registerFont(TTFont(font_item['name'], font_item['file']))
+                        register_font(font_item['name'], font_item['file'])
                         addMapping(font_family_name, font_item.get('bold', False),
                                 font_item.get('italic', False), font_item['name'])
 
             # Old style: font name and file path
             else:
-                pdfmetrics.registerFont(TTFont(font_family_name, fonts_or_file))
+                register_font(font_family_name, fonts_or_file)
 
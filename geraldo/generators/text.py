@@ -1,4 +1,4 @@
-import datetime
+import datetime, re
 from .base import ReportGenerator
 
 from geraldo.base import cm, TA_CENTER, TA_RIGHT
@@ -25,8 +25,19 @@ DEFAULT_ESCAPE_SET = {
         'line-spacing-short': chr(27)+chr(50),
         'italic': chr(27)+chr(52),
         'cancel-italic': chr(27)+chr(53),
+        'horizontal-tab': chr(9),
+        'horizontal-skip': chr(27)+chr(102)+chr(0), # ESC f 0 n - skips n columns
+        'vertical-skip': chr(27)+chr(102)+chr(1),   # ESC f 1 n - skips n rows
         }
 
+# Default tab stops on ESC/P2 printers are at every 8 columns
+DEFAULT_TAB_SIZE = 8
+
+# Highest count a single skip escape code can receive
+MAX_SKIP_COUNT = 127
+
+EXP_SPACES = re.compile(' {2,}')
+
 class Paragraph(object):
     text = ''
     style = None
@@ -62,6 +73,13 @@ class TextGenerator(ReportGenerator):
           encode the output string on it. Example: 'latin-1'
         * 'manual_escape_codes' - a boolean variable that sets escape codes are
           manually informed or not.
+        * 'compact_output' - a boolean variable that makes the output have the
+          least bytes possible: trailing spaces are trimmed and, when generating
+          to printer, runs of blank rows and spaces are replaced by line feed
+          runs, skip escape codes or tabs (the shortest one). Useful for printers
+          attached to slow serial/parallel links.
+        * 'tab_size' - the distance (in columns) between the printer tab stops.
+          Used only by 'compact_output'.
     """
     row_height = DEFAULT_ROW_HEIGHT
     character_width = DEFAULT_CHAR_WIDTH
@@ -69,6 +87,8 @@ class TextGenerator(ReportGenerator):
     _escape_set = DEFAULT_ESCAPE_SET
     encode_to = None
     manual_escape_codes = False
+    compact_output = False
+    tab_size = DEFAULT_TAB_SIZE
 
     escapes_report_start = ''
     escapes_report_end = ''
@@ -181,7 +201,7 @@ class TextGenerator(ReportGenerator):
         # Escapes
         self.add_escapes_report_start();
 
-        for num, page in enumerate([page for page in self._rendered_pages if page.elements]):
+        for num, page in self.get_pages_to_generate():
             # Escapes
             self.add_escapes_page_start(num);
 
@@ -196,7 +216,10 @@ class TextGenerator(ReportGenerator):
                     self.generate_widget(element, _page_output, num)
 
             # Adds the page output to output string
-            self._output = ''.join([self._output, '\n'.join(_page_output)])
+            if self.compact_output:
+                self._output = ''.join([self._output, self.compact_page_output(_page_output)])
+            else:
+                self._output = ''.join([self._output, '\n'.join(_page_output)])
 
             # Escapes
             self.add_escapes_page_end(num);
@@ -271,6 +294,79 @@ class TextGenerator(ReportGenerator):
             _temp = _temp[:text_rect['left']] + text + _temp[text_rect['right']:]
             page_output[text_rect['top']] = _temp[:self.get_page_columns_count()]
 
+    def compact_page_output(self, page_output):
+        """Returns the page output rows as a string with the least bytes possible.
+        Blank rows in the end of page are dropped when the page is ejected by a
+        form feed."""
+        rows = [row.rstrip() for row in page_output]
+
+        form_feed = self.escape_set.get('form-feed', None)
+        if self.to_printer and form_feed and form_feed in self.escapes_page_end:
+            while rows and not rows[-1]:
+                rows.pop()
+
+        output = []
+        line_feeds = 0
+
+        for num, row in enumerate(rows):
+            if num:
+                line_feeds += 1
+
+            if row:
+                output.append(self.make_vertical_skip(line_feeds))
+                output.append(self.compact_row(row))
+                line_feeds = 0
+
+        output.append(self.make_vertical_skip(line_feeds))
+
+        return ''.join(output)
+
+    def make_vertical_skip(self, count):
+        """Returns the shortest string to skip the informed count of rows: a
+        line feed run or the 'vertical-skip' escape code"""
+        escape = self.to_printer and self.escape_set.get('vertical-skip', None)
+        ret = ''
+
+        if escape:
+            while count > len(escape) + 1:
+                ret += escape + chr(min(count, MAX_SKIP_COUNT))
+                count -= min(count, MAX_SKIP_COUNT)
+
+        return ret + '\n' * count
+
+    def make_horizontal_skip(self, column, count):
+        """Returns the shortest string to skip the informed count of columns,
+        starting from the informed column: a spaces run, tabs (plus remaining
+        spaces) or the 'horizontal-skip' escape code"""
+        choices = [' ' * count]
+
+        if not self.to_printer:
+            return choices[0]
+
+        # Tabs jump to the next tab stop
+        tab = self.escape_set.get('horizontal-tab', None)
+        if tab and self.tab_size:
+            stops = (column + count) // self.tab_size - column // self.tab_size
+            if stops:
+                choices.append(tab * stops + ' ' * ((column + count) % self.tab_size))
+
+        escape = self.escape_set.get('horizontal-skip', None)
+        if escape:
+            skip, remaining = '', count
+            while remaining:
+                skip += escape + chr(min(remaining, MAX_SKIP_COUNT))
+                remaining -= min(remaining, MAX_SKIP_COUNT)
+            choices.append(skip)
+
+        return min(choices, key=len)
+
+    def compact_row(self, row):
+        """Replaces the spaces runs in a row by their shortest equivalent"""
+        return EXP_SPACES.sub(
+                lambda m: self.make_horizontal_skip(m.start(), len(m.group())),
+                row,
+                )
+
     def add_escapes_report_start(self):
         """Adds the escape commands to the output variable"""
         self._output = ''.join([self._output, self.escapes_report_start])
@@ -1,6 +1,15 @@
+import threading
+from collections import OrderedDict
+
 from .base import BAND_WIDTH, BAND_HEIGHT, Element
 from .utils import cm, black
 
+# Resolution images are downsampled to when drawn. None keeps them as they are
+DEFAULT_IMAGE_DPI = None
+
+# Maximum size (in decoded bytes) of images kept by the image cache
+IMAGE_CACHE_MAX_BYTES = 64*1024*1024
+
 class Graphic(Element):
     """Base graphic class"""
     stroke = True
@@ -145,16 +154,111 @@ class Ellipse(Fixed):
     """A simple circle"""
     pass
 
+def open_image(source):
+    """Uses Python Imaging Library to open an image from a file path or a
+    file-like object"""
+    try:
+        import Image as PILImage
+    except ImportError:
+        from PIL import Image as PILImage
+
+    return PILImage.open(source)
+
+def resize_image(image, size):
+    """Returns a copy of the image resized with a high quality filter"""
+    try:
+        import Image as PILImage
+    except ImportError:
+        from PIL import Image as PILImage
+
+    return image.resize(size, getattr(PILImage, 'LANCZOS', None) or PILImage.ANTIALIAS)
+
+class ImageCache(object):
+    """Process-wide cache of decoded images, keyed by their file path and the
+    size they are resized to (None for the original size). The least recently
+    used images are discarded when the decoded bytes exceed 'max_bytes'."""
+
+    max_bytes = None
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or IMAGE_CACHE_MAX_BYTES
+        self._images = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, source, size=None):
+        """Returns the image from the file path 'source', decoded just once and
+        downsampled to 'size' if informed"""
+        key = (source, size)
+
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        image = open_image(source)
+
+        if size and size != image.size:
+            # JPEG images can be decoded directly in a reduced scale
+            image.draft(image.mode, size)
+            image = resize_image(image, size)
+        else:
+            image.load()
+
+        self.set(key, image)
+
+        return image
+
+    def set(self, key, image):
+        with self._lock:
+            if key in self._images:
+                self._bytes -= self.get_image_bytes(self._images.pop(key))
+
+            self._images[key] = image
+            self._bytes += self.get_image_bytes(image)
+
+            # Discards the least recently used images, but the new one
+            while self._bytes > self.max_bytes and len(self._images) > 1:
+                old_key, old_image = self._images.popitem(last=False)
+                self._bytes -= self.get_image_bytes(old_image)
+
+    def get_image_bytes(self, image):
+        return image.size[0] * image.size[1] * len(image.getbands())
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._images)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+image_cache = ImageCache()
+
 class Image(Graphic):
-    """A image"""
+    """A image.
+    
+    The image comes from 'filename' or from the lambda 'get_image', that can
+    return an image object or a file path. Images from file paths are decoded
+    once per process and shared by the image cache.
+
+    Set 'dpi' to downsample the image to that resolution, considering the width
+    and height it is drawn on."""
     left = None
     top = None
     _width = None
     _height = None
     filename = None
     _image = None # PIL image object is stored here
+    _source = None
+    _image_resolved = False
     get_image = None # To be overrided
     stretch = False
+    dpi = None
 
     _repr_for_cache_attrs = ('left','top','height','width','visible','stroke',
             'stroke_color','stroke_width','fill','fill_color','filename')
@@ -168,22 +272,47 @@ class Image(Graphic):
         new.filename = self.filename
         new._image = self._image
         new.get_image = self.get_image
+        new.stretch = self.stretch
+        new.dpi = self.dpi
 
         return new
 
+    def _resolve_image(self):
+        """Calls 'get_image' just once for this element and finds the file path
+        the image is loaded from"""
+        if self._image_resolved:
+            return
+
+        self._image_resolved = True
+
+        if self.get_image:
+            image = self.get_image(self)
+
+            # 'get_image' can return a file path instead of an image object
+            if isinstance(image, str):
+                self._source, self._image = image, None
+            else:
+                self._image = image
+
+        if not self._source and isinstance(self.filename, str) and\
+           not (self.get_image and self._image):
+            self._source = self.filename
+
+    def _get_source(self):
+        self._resolve_image()
+        return self._source
+    source = property(_get_source)
+
     def _get_image(self):
         """Uses Python Imaging Library to load an image and get its
         informations"""
-        if self.get_image:
-            self._image = self.get_image(self)
+        self._resolve_image()
 
-        if not self._image and self.filename:
-            try:
-                import Image as PILImage
-            except ImportError:
-                from PIL import Image as PILImage
+        if not self._image and self._source:
+            self._image = image_cache.get(self._source)
 
-            self._image = PILImage.open(self.filename)
+        elif not self._image and self.filename:
+            self._image = open_image(self.filename)
 
         return self._image
 
@@ -192,6 +321,34 @@ class Image(Graphic):
 
     image = property(_get_image, _set_image)
 
+    def get_scaled_image(self, dpi=None):
+        """Returns the image downsampled to the resolution 'dpi' (default is
+        the attribute 'dpi'), considering the drawn width and height. Returns
+        the image itself if it hasn't more pixels than necessary."""
+        dpi = dpi or self.dpi or DEFAULT_IMAGE_DPI
+        image = self.image
+
+        if not dpi or not image:
+            return image
+
+        # Points to pixels in the informed resolution
+        scale_x = float(self.width) * dpi / (2.54*cm) / image.size[0]
+        scale_y = float(self.height) * dpi / (2.54*cm) / image.size[1]
+
+        if self.stretch:
+            scales = (min(scale_x, 1), min(scale_y, 1))
+        else:
+            scales = (min(scale_x, scale_y, 1),) * 2
+
+        size = tuple([max(int(round(d * sc)), 1) for d, sc in zip(image.size, scales)])
+
+        if size == image.size:
+            return image
+        elif self.source:
+            return image_cache.get(self.source, size)
+
+        return resize_image(image, size)
+
     def _get_height(self):
         ret = self._height or (self.image and self.image.size[1] or 0)
         return ret * 0.02*cm
@@ -209,4 +366,3 @@ class Image(Graphic):
         self._width = value
 
     width = property(_get_width, _set_width)
-
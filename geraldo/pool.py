@@ -0,0 +1,340 @@
+"""Pool of report worker processes, started once and kept warm: they have the
+generators imported, the additional fonts registered and the report classes
+prepared (see Report.prepare) before the first job.
+
+Example:
+
+    >>> pool = ReportPool(report_classes=[MyReport], processes=4, timeout=30)
+    >>> pool.generate_by(MyReport, queryset, PDFGenerator, filename='test.pdf')
+    >>> content = pool.generate_by(MyReport, queryset, PDFGenerator)
+    >>> pool.close()
+
+Report classes must be declared before the pool starts, and querysets must be
+picklable, as they are sent to the worker processes. Big querysets can be
+sent as shared datasets (see geraldo.dataset), pickled as a file handle."""
+
+import os, time, queue, shutil, tempfile, threading, multiprocessing
+
+from .base import get_report_class_by_registered_id
+from .exceptions import PoolTimeout, PoolWorkerError, PoolClosed
+
+# Workers are forked where possible, to inherit modules imported and report
+# classes declared by the parent process. Forking while other threads run can
+# deadlock the child on locks they hold, so workers started then are started
+# by the fork server (or spawned), importing the report classes again.
+if 'fork' in multiprocessing.get_all_start_methods():
+    DEFAULT_START_METHOD = 'fork'
+else:
+    DEFAULT_START_METHOD = None
+
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    THREADED_START_METHOD = 'forkserver'
+else:
+    THREADED_START_METHOD = 'spawn'
+
+def _get_report_class(registered_id):
+    report_class = get_report_class_by_registered_id(registered_id)
+    if report_class is None:
+        raise PoolWorkerError('Report class "%s" is not declared in the worker process'%registered_id)
+
+    return report_class
+
+def _run_worker(conn, registered_ids, initializer):
+    """Main function of worker processes. Prepares the report classes and runs
+    jobs received by the connection until it gets None or is closed."""
+    from .generators import PDFGenerator
+
+    for registered_id in registered_ids:
+        prepared = _get_report_class(registered_id).prepare()
+        PDFGenerator(prepared.report, filename=None).prepare_additional_fonts()
+
+    if initializer:
+        initializer()
+
+    conn.send('ready')
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if job is None:
+            break
+
+        registered_id, queryset, generator_class, args, kwargs = job
+
+        try:
+            report = _get_report_class(registered_id).prepare().bind(queryset)
+            conn.send((True, report.generate_by(generator_class, *args, **kwargs)))
+        except Exception as e:
+            # Exceptions are raised by the parent process, if they can be pickled
+            try:
+                conn.send((False, e))
+            except Exception:
+                conn.send((False, PoolWorkerError(repr(e))))
+
+class PoolWorker(object):
+    """A worker process and the connection to send it jobs"""
+
+    process = None
+    conn = None
+    jobs_count = 0
+    ready = False
+
+    def __init__(self, context, registered_ids, initializer=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_run_worker,
+                args=(child_conn, registered_ids, initializer))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout=None):
+        """Waits for the report classes to be prepared by the process, up to
+        'timeout' seconds"""
+        if self.ready:
+            return
+
+        # The process is checked as well, as its connection could be kept open
+        # by other processes
+        deadline = timeout is not None and time.time() + timeout
+        while not self.conn.poll(0.5):
+            if not self.process.is_alive():
+                raise PoolWorkerError('Worker process died while starting (exit code %s)'%
+                        self.process.exitcode)
+
+            if deadline and time.time() > deadline:
+                raise PoolWorkerError('Worker process did not start in %s seconds'%timeout)
+
+        try:
+            self.ready = self.conn.recv() == 'ready'
+        except EOFError:
+            self.process.join(1)
+            raise PoolWorkerError('Worker process died while starting (exit code %s)'%
+                    self.process.exitcode)
+
+    def stop(self, timeout=None):
+        """Asks the process to finish, and terminates it if it doesn't in
+        'timeout' seconds (or at once, if 'timeout' is 0)"""
+        if timeout != 0:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+
+            self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.conn.close()
+
+class ReportPool(object):
+    """Pool of warm report worker processes.
+
+    - 'report_classes' are prepared by every worker when it starts
+    - 'processes' is the number of workers (default: the number of CPUs)
+    - 'timeout' is the default limit in seconds of a job. Workers running
+      longer jobs are terminated and replaced
+    - 'max_jobs' is the number of jobs a worker runs before being replaced
+      (default: None, never)
+    - 'initializer' is a function called by every worker when it starts
+    - 'start_timeout' is the limit in seconds for a worker to start (default:
+      60). Workers not started by then are terminated and replaced
+
+    Jobs wait in a local queue for an idle worker, so generate_by can be called
+    from many threads. Workers are forked (see DEFAULT_START_METHOD) unless
+    other threads are running, as when replaced while jobs run on threads:
+    then they are started by THREADED_START_METHOD, and the report classes
+    must be importable from their modules."""
+
+    timeout = None
+    max_jobs = None
+    start_timeout = 60
+    start_method = DEFAULT_START_METHOD
+    threaded_start_method = THREADED_START_METHOD
+
+    def __init__(self, report_classes=None, processes=None, timeout=None, max_jobs=None,
+            initializer=None, start_timeout=None):
+        self.registered_ids = [report_class._registered_id for report_class in report_classes or []]
+        self.processes = processes or multiprocessing.cpu_count()
+        self.timeout = timeout or self.timeout
+        self.max_jobs = max_jobs or self.max_jobs
+        self.initializer = initializer
+        self.start_timeout = start_timeout or self.start_timeout
+
+        self._context = multiprocessing.get_context(self.start_method)
+        self._threaded_context = multiprocessing.get_context(self.threaded_start_method)
+        self._idle_workers = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._running_jobs = 0
+        self._jobs_done = threading.Condition(self._lock)
+
+        for num in range(self.processes):
+            self._idle_workers.put(self.start_worker())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_context(self):
+        """Returns the multiprocessing context to start a worker. Processes are
+        not forked while other threads run (see geraldo.generators.base.
+        ReportGenerator.can_pipeline)"""
+        if self._context.get_start_method() == 'fork' and threading.active_count() > 1:
+            return self._threaded_context
+
+        return self._context
+
+    def start_worker(self):
+        worker = PoolWorker(self.get_context(), self.registered_ids, self.initializer)
+
+        with self._lock:
+            self._workers.add(worker)
+
+        return worker
+
+    def restart_worker(self, worker):
+        """Terminates the worker at once and returns a new one, or None if the
+        pool is closed"""
+        worker.stop(timeout=0)
+
+        with self._lock:
+            self._workers.discard(worker)
+
+        if self._closed:
+            return None
+
+        return self.start_worker()
+
+    def generate_by(self, report_class, queryset, generator_class, *args, **kwargs):
+        """Generates a report of 'report_class' for 'queryset' by a worker, the
+        same way 'report.generate_by' does. The argument 'timeout' overrides
+        the pool one.
+
+        If 'filename' is a path the worker writes the file itself. Otherwise
+        the output is passed by a temporary file and written to the file-like
+        object in 'filename', or returned if there is no 'filename'."""
+        if self._closed:
+            raise PoolClosed('The pool is closed, no more jobs are accepted')
+
+        timeout = kwargs.pop('timeout', self.timeout)
+        filename = kwargs.get('filename', None)
+
+        # Output through a temporary file
+        temp_path = None
+        if not isinstance(filename, str):
+            fd, temp_path = tempfile.mkstemp(prefix='geraldo-')
+            os.close(fd)
+            kwargs['filename'] = temp_path
+
+        job = (report_class._registered_id, queryset, generator_class, args, kwargs)
+
+        try:
+            ret = self.run_job(job, timeout)
+
+            if temp_path:
+                if filename is None:
+                    with open(temp_path, 'rb') as fp:
+                        return fp.read()
+
+                with open(temp_path, 'rb') as fp:
+                    shutil.copyfileobj(fp, filename)
+
+            return ret
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def run_job(self, job, timeout=None):
+        """Sends the job to an idle worker and returns its result"""
+        with self._lock:
+            self._running_jobs += 1
+
+        worker = None
+        try:
+            worker = self._idle_workers.get()
+
+            # The pool was closed while waiting (other waiting jobs are woken too)
+            if worker is None:
+                self._idle_workers.put(None)
+                raise PoolClosed('The pool is closed, no more jobs are accepted')
+
+            worker.wait_ready(self.start_timeout)
+            worker.conn.send(job)
+            worker.jobs_count += 1
+
+            if not worker.conn.poll(timeout):
+                worker = self.restart_worker(worker)
+                raise PoolTimeout('Report generation exceeded %s seconds'%timeout)
+
+            try:
+                success, ret = worker.conn.recv()
+            except EOFError:
+                worker.process.join(1)
+                exitcode = worker.process.exitcode
+                worker = self.restart_worker(worker)
+                if self._closed:
+                    raise PoolClosed('The pool was closed before the job finished')
+                raise PoolWorkerError('Worker process died (exit code %s)'%exitcode)
+
+            if self.max_jobs and worker.jobs_count >= self.max_jobs:
+                worker = self.restart_worker(worker)
+
+            if not success:
+                raise ret
+
+            return ret
+        except PoolWorkerError:
+            # Workers failing to start are replaced as well
+            if worker and (not worker.ready or not worker.process.is_alive()):
+                worker = self.restart_worker(worker)
+            raise
+        finally:
+            if worker and self._closed:
+                worker.stop()
+
+                with self._lock:
+                    self._workers.discard(worker)
+            elif worker:
+                self._idle_workers.put(worker)
+
+            with self._lock:
+                self._running_jobs -= 1
+                self._jobs_done.notify_all()
+
+    def close(self, timeout=10):
+        """Stops accepting jobs and stops the workers. Running jobs are waited
+        for up to 'timeout' seconds, and then their workers are terminated."""
+        with self._lock:
+            self._closed = True
+
+        # Idle workers are stopped at once, and jobs waiting for them are woken
+        while True:
+            try:
+                worker = self._idle_workers.get_nowait()
+            except queue.Empty:
+                break
+
+            if worker:
+                worker.stop(timeout)
+
+                with self._lock:
+                    self._workers.discard(worker)
+
+        self._idle_workers.put(None)
+
+        # Workers of running jobs are stopped by them when they finish, or
+        # terminated after the timeout, failing the jobs
+        with self._lock:
+            self._jobs_done.wait_for(lambda: not self._running_jobs, timeout)
+            workers = list(self._workers)
+
+        for worker in workers:
+            worker.process.terminate()
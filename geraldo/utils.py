@@ -1,4 +1,4 @@
-import sys
+import sys, threading, itertools, asyncio
 import collections
 
 try:
@@ -52,12 +52,13 @@ SYSTEM_FIELD_CHOICES = {
 def _get_memoized_value(func, args, kwargs):
     """Used internally by memoize decorator to get/store function results"""
     key = (repr(args), repr(kwargs))
-    
-    if not key in func._cache_dict:
-        ret = func(*args, **kwargs)
-        func._cache_dict[key] = ret
 
-    return func._cache_dict[key]
+    try:
+        return func._cache_dict[key]
+    except KeyError:
+        # Concurrent threads can calculate the same value, but just the first
+        # one is stored
+        return func._cache_dict.setdefault(key, func(*args, **kwargs))
 
 def memoize(func):
     """Decorator that stores function results in a dictionary to be used on the
@@ -73,6 +74,62 @@ def memoize(func):
     else:
         return wraps(func)(_inner)
 
+class LRUCache(object):
+    """A dictionary-like cache bounded by its items count, that discards the
+    least recently used items when it is full. It is safe to be shared among
+    threads. Attributes 'hits' and 'misses' count the lookups made by 'get'."""
+
+    max_items = None
+    hits = 0
+    misses = 0
+
+    def __init__(self, max_items=1000):
+        self.max_items = max_items
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def get_stats(self):
+        """Returns a dictionary with items count, hits, misses and the hit rate
+        (from 0 to 1) of this cache"""
+        lookups = self.hits + self.misses
+
+        return {
+            'items': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': lookups and float(self.hits) / lookups or 0.0,
+            }
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
 def get_attr_value(obj, attr_path):
     """This function gets an attribute value from an object. If the attribute
     is a method with no arguments (or arguments with default values) it calls
@@ -158,3 +215,236 @@ def run_under_process(func):
 
     return _inner
 
+
+class AsyncIterableReader(object):
+    """Iterable over an asynchronous iterable (i.e. rows fetched by an async
+    database driver), to be used as the queryset of a report generated on a
+    thread. The event loop fetches the rows while the thread reads them,
+    waiting just for rows not fetched yet, and stops fetching when 'max_rows'
+    rows are waiting to be read. It must be made on the event loop.
+
+    Rows read are kept, so it can be iterated again, like lists, to compute
+    aggregations and group filters (the generator keeps them anyway)."""
+
+    max_rows = 1000
+
+    def __init__(self, aiterable, loop, max_rows=None):
+        self.max_rows = max_rows or self.max_rows
+
+        self._read = []
+        self._rows = collections.deque()
+        self._done = False
+        self._error = None
+        self._condition = threading.Condition()
+
+        self._loop = loop
+        self._space = asyncio.Event()
+        self._task = loop.create_task(self._fetch(aiterable))
+
+    def close(self):
+        """Stops fetching rows the generation didn't read (i.e. on preview)"""
+        self._task.cancel()
+
+    async def _fetch(self, aiterable):
+        try:
+            async for row in aiterable:
+                # Waits for the thread to read rows when the buffer is full
+                while True:
+                    with self._condition:
+                        if len(self._rows) < self.max_rows:
+                            self._rows.append(row)
+                            self._condition.notify()
+                            break
+
+                        self._space.clear()
+
+                    await self._space.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify()
+
+    def _read_next(self):
+        """Waits for the next row and moves it to the rows read. Returns False
+        when there are no more rows"""
+        with self._condition:
+            while not self._rows and not self._done:
+                self._condition.wait()
+
+            if not self._rows:
+                if self._error is not None:
+                    raise self._error
+                return False
+
+            if len(self._rows) == self.max_rows:
+                self._loop.call_soon_threadsafe(self._space.set)
+
+            self._read.append(self._rows.popleft())
+            return True
+
+    def __bool__(self):
+        return bool(self._read) or self._read_next()
+
+    def __iter__(self):
+        index = 0
+        while index < len(self._read) or self._read_next():
+            yield self._read[index]
+            index += 1
+
+class AsyncChunksWriter(object):
+    """File-like object that sends what a generator on a thread writes to an
+    asyncio queue, in chunks of 'chunk_size' bytes. Method 'close' sends the
+    remaining bytes and None, and must be called on the event loop."""
+
+    def __init__(self, loop, queue, chunk_size):
+        self._loop = loop
+        self._queue = queue
+        self._chunk_size = chunk_size
+        self._buffer = b''
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        data = self._buffer + data
+        end = len(data) - len(data) % self._chunk_size
+
+        for start in range(0, end, self._chunk_size):
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, data[start:start + self._chunk_size])
+
+        self._buffer = data[end:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._buffer:
+            self._queue.put_nowait(self._buffer)
+            self._buffer = b''
+
+        self._queue.put_nowait(None)
+
+def iter_batches(queryset, batch_size):
+    """Yields lists of up to 'batch_size' objects of a queryset. DB-API cursors
+    are read by 'fetchmany' and Django querysets not evaluated yet by
+    'iterator' with 'chunk_size', so rows come from the database in batches."""
+    if hasattr(queryset, 'fetchmany'):
+        while True:
+            batch = queryset.fetchmany(batch_size)
+            if not batch:
+                break
+
+            yield list(batch)
+
+        return
+
+    closing = None
+    if hasattr(queryset, 'iterator') and hasattr(queryset, 'db') and\
+       getattr(queryset, '_result_cache', None) is None:
+        # Fetched with a connection of this thread, that must be closed after
+        from django.db import connections
+        closing = connections[queryset.db]
+        queryset = queryset.iterator(chunk_size=batch_size)
+
+    try:
+        iterator = iter(queryset)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                break
+
+            yield batch
+    finally:
+        if closing is not None:
+            closing.close()
+
+class PrefetchingReader(object):
+    """Iterator over a queryset fetched in batches of 'batch_size' objects (see
+    iter_batches) by a thread, keeping up to 'max_batches' batches ahead of the
+    reading, so the database latency overlaps with the rendering. The queryset
+    must be usable from another thread."""
+
+    def __init__(self, queryset, batch_size, max_batches=2):
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+
+        self._batches = collections.deque()
+        self._batch = []
+        self._position = 0
+        self._done = False
+        self._closed = False
+        self._error = None
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._fetch, args=(queryset,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self, timeout=1):
+        """Stops fetching objects the generation didn't read (i.e. on preview),
+        waiting up to 'timeout' seconds for the thread to finish, so it doesn't
+        outlive the generation (see ReportGenerator.can_pipeline)"""
+        with self._condition:
+            self._closed = True
+            self._batches.clear()
+            self._condition.notify_all()
+
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _fetch(self, queryset):
+        batches = iter_batches(queryset, self.batch_size)
+
+        try:
+            for batch in batches:
+                with self._condition:
+                    while len(self._batches) >= self.max_batches and not self._closed:
+                        self._condition.wait()
+
+                    if self._closed:
+                        break
+
+                    self._batches.append(batch)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            batches.close()
+
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def _next_batch(self):
+        """Waits for a batch and returns an empty list when there are no more"""
+        with self._condition:
+            while not self._batches and not self._done and not self._closed:
+                self._condition.wait()
+
+            if self._batches:
+                batch = self._batches.popleft()
+                self._condition.notify_all()
+                return batch
+
+        if self._error is not None and not self._closed:
+            raise self._error
+
+        return []
+
+    def __bool__(self):
+        if self._position >= len(self._batch):
+            self._batch, self._position = self._next_batch(), 0
+
+        return bool(self._batch)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self:
+            raise StopIteration
+
+        self._position += 1
+        return self._batch[self._position - 1]
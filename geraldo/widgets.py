@@ -9,9 +9,14 @@ except NameError:
 from .base import BAND_WIDTH, BAND_HEIGHT, Element, SubReport
 from .utils import get_attr_value, SYSTEM_FIELD_CHOICES, FIELD_ACTION_VALUE, FIELD_ACTION_COUNT,\
         FIELD_ACTION_AVG, FIELD_ACTION_MIN, FIELD_ACTION_MAX, FIELD_ACTION_SUM,\
-        FIELD_ACTION_DISTINCT_COUNT, cm, black
+        FIELD_ACTION_DISTINCT_COUNT, cm, black, memoize
 from .exceptions import AttributeNotFound
 
+@memoize
+def compile_expression(expression):
+    """Compiles an expression just once, to be evaluated for every object"""
+    return compile(expression, '<expression>', 'eval')
+
 class Widget(Element):
     """A widget is a value representation on the report"""
     _height = 0 #0.5*cm
@@ -175,6 +180,15 @@ class ObjectValue(Label):
         objects = self.generator.get_current_queryset()
         return [self.get_object_value(obj, attribute_name) for obj in objects]
 
+    def get_queryset_aggregate(self, action, attribute_name=None):
+        """Returns a tuple with the aggregation of the attribute value computed
+        by the current queryset itself (i.e. by SQL, see geraldo.datasources),
+        or an empty tuple if it can't compute it"""
+        if self.get_value:
+            return ()
+
+        return self.generator.get_queryset_aggregate(action, attribute_name or self.attribute_name)
+
     def _clean_empty_values(self, values):
         def clean(val):
             if not val:
@@ -192,11 +206,19 @@ class ObjectValue(Label):
         return self.get_object_value(attribute_name=attribute_name)
 
     def action_count(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_COUNT, attribute_name)
+        if aggregate:
+            return aggregate[0]
+
         # Returns the total count of objects with valid values on informed attribute
         values = self.get_queryset_values(attribute_name)
         return len([v for v in values if v is not None])
 
     def action_avg(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_AVG, attribute_name)
+        if aggregate:
+            return self._clean_empty_values(aggregate)[0]
+
         values = self.get_queryset_values(attribute_name)
 
         # Clear empty values
@@ -205,14 +227,26 @@ class ObjectValue(Label):
         return sum(values) / len(values)
 
     def action_min(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_MIN, attribute_name)
+        if aggregate:
+            return aggregate[0]
+
         values = self.get_queryset_values(attribute_name)
         return min(values)
 
     def action_max(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_MAX, attribute_name)
+        if aggregate:
+            return aggregate[0]
+
         values = self.get_queryset_values(attribute_name)
         return max(values)
 
     def action_sum(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_SUM, attribute_name)
+        if aggregate:
+            return self._clean_empty_values(aggregate)[0]
+
         values = self.get_queryset_values(attribute_name)
 
         # Clear empty values
@@ -221,6 +255,10 @@ class ObjectValue(Label):
         return sum(values)
 
     def action_distinct_count(self, attribute_name=None):
+        aggregate = self.get_queryset_aggregate(FIELD_ACTION_DISTINCT_COUNT, attribute_name)
+        if aggregate:
+            return aggregate[0]
+
         values = [v for v in self.get_queryset_values(attribute_name) if v is not None]
         return len(set(values))
 
@@ -295,7 +333,7 @@ class ObjectValue(Label):
                 })
 
         try:
-            return eval(expression, global_vars)
+            return eval(compile_expression(expression), global_vars)
         except Exception as e:
             if not isinstance(self.on_expression_error, collections.Callable):
                 raise
@@ -352,7 +390,7 @@ class SystemField(Label):
     def clone(self):
         new = super(SystemField, self).clone()
         new.expression = self.expression
-        new.fields = self.fields
+        new.fields = self.fields.copy() # Generators set fields on every clone
 
         return new
 